@@ -0,0 +1,50 @@
+import argparse
+import json
+from collections import Counter
+
+from library.assets import AssetPack, compileAssets
+from library.constants import AssetKind, ASSET_PACK_PATH
+from library.snapshot import writeAtomically
+
+# Compiles readable asset source files into an asset pack for the game to load, e.g.
+# `python asset_compiler.py assets/world.json`; see assets/world.json for the source format.
+
+parser = argparse.ArgumentParser(description="Compile asset source files into an asset pack.")
+parser.add_argument("sources", nargs="+", help="JSON source files to compile into one pack; assets may refer to "
+                                               "assets in other files")
+parser.add_argument("-o", "--output", default=ASSET_PACK_PATH, help="asset pack to write")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Merge the sources section by section
+    source = {}
+    for path in args.sources:
+        with open(path) as file:
+            try:
+                sections = json.load(file)
+            except ValueError as e:
+                parser.error(f"{path} is not valid JSON: {e}")
+        if not isinstance(sections, dict) or not all(isinstance(assets, dict) for assets in sections.values()):
+            parser.error(f"{path} must be an object of sections, each an object of assets.")
+
+        for section, assets in sections.items():
+            merged = source.setdefault(section, {})
+            for name, asset in assets.items():
+                if name in merged:
+                    parser.error(f"{name} in {section} is defined more than once.")
+                merged[name] = asset
+
+    try:
+        data = compileAssets(source)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Replace the pack in one go, so that a running game keeps the old pack mapped rather than reading half of one
+    writeAtomically(args.output, data)
+
+    pack = AssetPack(args.output)
+    counts = Counter(AssetKind(kind).name.lower() for kind in pack.entries["kind"].tolist())
+    pack.close()
+    print(f"Wrote {args.output} ({len(data)} bytes): " +
+          ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items())))
@@ -0,0 +1,338 @@
+import sys
+import os
+import json
+import random
+import tracemalloc
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, time
+
+from library import classes
+from library.assets import AssetPack, compileAssets
+from library.classes import Ghost, GameManager, SenseHatRef
+from library.constants import HUDState
+from library.display import DisplayGeometry
+from library.ghosttypes import BASIC, GHOST_TYPES, getGhostTypeId, registerGhostType
+from library.movement import MovementEngine
+from library.scheduler import GhostScheduler
+from library.simulation import SimClock, StandInSenseHat, installClock
+from library.snapshot import encodeGhosts, decodeGhosts, encodeSnapshot, decodeSnapshot, loadSnapshot, writeAtomically
+
+# Run with `python benchmarks.py [name ...]` from this directory; runs every benchmark if no names are given.
+
+
+def timeIt(func, repeats=5) -> float:
+    """ Returns the best time in seconds taken to call func out of a number of repeats. """
+    best = float("inf")
+    for _ in range(repeats):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def makeGhosts(n: int) -> list:
+    """ Creates n ghosts of random types. """
+    return [Ghost(random.randrange(len(GHOST_TYPES))) for _ in range(n)]
+
+
+def benchmarkSnapshot(n=10000):
+    """ Measures the size of a snapshot of n ghosts, how long the ghost section takes to encode and decode, and how
+    long a whole game takes to save to and load from disk.
+    """
+    gm = GameManager(StandInSenseHat(), threaded=False)
+    gm.ghosts = makeGhosts(n)
+    now = time()
+    data, num_type_names, type_table_len = encodeGhosts(gm.ghosts, now)
+
+    encode_time = timeIt(lambda: encodeGhosts(gm.ghosts, now))
+    decode_time = timeIt(lambda: decodeGhosts(data, 0, n, num_type_names, type_table_len, now))
+
+    restored = GameManager(StandInSenseHat(), threaded=False)
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot.ghst")
+        save_time = timeIt(lambda: writeAtomically(path, encodeSnapshot(gm)))
+        load_time = timeIt(lambda: loadSnapshot(restored, path))
+        size = os.path.getsize(path)
+
+    print(f"snapshot of {n} ghosts: {size} bytes ({size / n:.1f} per ghost)")
+    print(f"  ghost section: encode {encode_time * 1000:.1f} ms, decode {decode_time * 1000:.1f} ms")
+    print(f"  whole game: save {save_time * 1000:.1f} ms, load {load_time * 1000:.1f} ms")
+
+    # Check a restored game can carry on: save one with the charge bar full, load it, and render a frame
+    gm = GameManager(StandInSenseHat(), threaded=False)
+    gm.ghosts = makeGhosts(10)
+    gm.attack_system.time_last_attacked = 0
+    restored = GameManager(StandInSenseHat(), threaded=False)
+    decodeSnapshot(restored, encodeSnapshot(gm))
+    if type(restored.attack_system.attack_cooldown) is not type(gm.attack_system.attack_cooldown):
+        raise RuntimeError("Restoring a snapshot changed the type of the attack cooldown.")
+    restored.prepareToRender()
+    restored.render()
+
+
+def benchmarkGhostTypes(n=10000):
+    """ Measures the time and memory taken to spawn n ghosts of mixed types, and the time to iterate over them. """
+    def iterate():
+        for ghost in ghosts:
+            ghost.movePassively()
+            for row in ghost.appearance:
+                for pxl in row:
+                    pass
+
+    spawn_time = timeIt(lambda: makeGhosts(n))
+
+    tracemalloc.start()
+    ghosts = makeGhosts(n)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    iterate_time = timeIt(iterate)
+
+    print(f"{n} ghosts of {len(GHOST_TYPES)} types: {memory / n:.0f} bytes per ghost")
+    print(f"  spawn {spawn_time * 1000:.1f} ms, move and iterate sprites {iterate_time * 1000:.1f} ms")
+
+
+def benchmarkMovement(sizes=(1000, 10000, 100000)):
+    """ Compares moving every ghost through Ghost.updateMovement with moving them in bulk with a MovementEngine. """
+    for n in sizes:
+        ghosts = makeGhosts(n)
+        repeats = 5
+
+        # Make every ghost due to move before each timed pass
+        object_time = float("inf")
+        for _ in range(repeats):
+            for ghost in ghosts:
+                ghost.time_last_moved = 0
+            start = perf_counter()
+            for ghost in ghosts:
+                ghost.updateMovement()
+            object_time = min(object_time, perf_counter() - start)
+
+        engine = MovementEngine(ghosts, seed=0)
+        engine_time = float("inf")
+        for _ in range(repeats):
+            engine.time_last_moved[:] = 0
+            start = perf_counter()
+            engine.step(time())
+            engine_time = min(engine_time, perf_counter() - start)
+
+        print(f"moving {n} ghosts: per object {object_time * 1000:.1f} ms, engine {engine_time * 1000:.1f} ms "
+              f"({object_time / engine_time:.1f}x)")
+
+
+def benchmarkRender(sizes=(8, 64, 256), num_ghosts=20, frames=200):
+    """ Measures the time to draw and present a frame with the HUD and some moving ghosts on square displays of
+    different sizes; with no displays attached, this is the cost of the render path itself.
+    """
+    for size in sizes:
+        gm = GameManager(StandInSenseHat(), threaded=False, geometry=DisplayGeometry(size, size), displays=[])
+        gm.attack_system.hud_state = HUDState.BRIGHT
+        gm.ghosts = makeGhosts(num_ghosts)
+        gm.proximity_bar.bar_height = gm.proximity_bar.max_bar_height // 2
+
+        start = perf_counter()
+        for frame in range(frames):
+            # Move each ghost across the display
+            for i, ghost in enumerate(gm.ghosts):
+                ghost.relative_sense.pxl_pos = [(frame + i * 3) % size, (i * 5) % size]
+            gm.prepareToRender()
+            gm.render()
+        frame_time = (perf_counter() - start) / frames
+
+        print(f"rendering {size}x{size} with {num_ghosts} ghosts: {frame_time * 1e6:.0f} us per frame")
+
+
+def benchmarkScheduler(sizes=(1000, 10000, 50000), frames=40, frame_time=0.05):
+    """ Compares the per frame cost of updating every ghost (moving with a MovementEngine, then Ghost.updateGhost and
+    a search over all ghosts for the proximity bar) with a GhostScheduler, while the player turns steadily.
+    """
+    geometry = DisplayGeometry()
+    real_time = classes.time
+    try:
+        for n in sizes:
+            random.seed(0)
+            ghosts = makeGhosts(n)
+            orientations = [{"roll": 90.0, "pitch": 0.0, "yaw": (frame * 3.0) % 360} for frame in range(frames)]
+
+            # Ghosts read the time themselves when updated every frame, so give them the simulated time too
+            clock = SimClock(ghosts[0].time_last_moved)
+            installClock(clock)
+            engine = MovementEngine(ghosts, seed=0)
+            start = perf_counter()
+            for orientation in orientations:
+                clock.advance(frame_time)
+                engine.step(clock.now)
+                for ghost in ghosts:
+                    ghost.updateGhost(orientation, geometry, move=False)
+                min(ghosts, key=lambda ghost: ghost.relative_sense.distance)
+            polling_time = (perf_counter() - start) / frames
+
+            random.seed(0)
+            ghosts = makeGhosts(n)
+            clock = SimClock(ghosts[0].time_last_moved)
+            engine = MovementEngine(ghosts, seed=0)
+            scheduler = GhostScheduler(engine, geometry, clock.now)
+            num_fired = 0
+            num_in_view = 0
+            start = perf_counter()
+            for orientation in orientations:
+                clock.advance(frame_time)
+                num_in_view += len(scheduler.step(clock.now, orientation))
+                scheduler.findNearestGhost(orientation)
+                num_fired += scheduler.num_fired
+            scheduled_time = (perf_counter() - start) / frames
+
+            print(f"{n} ghosts: polling {polling_time * 1000:.2f} ms, scheduled {scheduled_time * 1000:.2f} ms "
+                  f"per frame ({polling_time / scheduled_time:.1f}x)")
+            print(f"  {num_fired / frames:.0f} events fired and {num_in_view / frames:.0f} ghosts in view per frame, "
+                  f"{scheduled_time * frames / max(1, num_fired + num_in_view) * 1e6:.1f} us per event or ghost in "
+                  f"view")
+    finally:
+        classes.time = real_time
+
+
+def benchmarkSchedulerEvents(sizes=(1000, 10000, 50000, 200000), active=1000, frames=40, frame_time=0.05):
+    """ Measures the per frame cost of a GhostScheduler as the number of ghosts grows while the number of events
+    fired per frame stays the same. Only a fixed number of ghosts are active; the rest are of a type that never moves,
+    and are placed out of view of the player, so they only add to the population.
+    """
+    if "dormant" not in (ghost_type.name for ghost_type in GHOST_TYPES):
+        registerGhostType(GHOST_TYPES[BASIC]._replace(name="dormant", passive_move_delay=float("inf"),
+                                                       panicked_move_delay=float("inf")))
+    dormant = getGhostTypeId("dormant")
+
+    geometry = DisplayGeometry()
+    orientations = [{"roll": 90.0, "pitch": 0.0, "yaw": (frame * 3.0) % 360} for frame in range(frames)]
+    real_time = classes.time
+    try:
+        for n in sizes:
+            # Make the ghosts on the simulated clock, so the time taken to make them does not count towards their
+            # panic or moves
+            clock = SimClock(time())
+            installClock(clock)
+            random.seed(0)
+            ghosts = [Ghost(BASIC) for _ in range(active)]
+            for _ in range(n - active):
+                ghost = Ghost(dormant)
+                # The player faces 90 degrees vertically, so this is further away than the reach of the display
+                ghost.angle = [random.uniform(0, 360), random.uniform(0, 40)]
+                ghosts.append(ghost)
+
+            engine = MovementEngine(ghosts, seed=0)
+            scheduler = GhostScheduler(engine, geometry, clock.now)
+            num_fired = 0
+            num_in_view = 0
+            start = perf_counter()
+            for orientation in orientations:
+                clock.advance(frame_time)
+                num_in_view += len(scheduler.step(clock.now, orientation))
+                scheduler.findNearestGhost(orientation)
+                num_fired += scheduler.num_fired
+            scheduled_time = (perf_counter() - start) / frames
+
+            print(f"{n} ghosts ({active} active): scheduled {scheduled_time * 1000:.2f} ms per frame, "
+                  f"{num_fired / frames:.0f} events fired and {num_in_view / frames:.0f} ghosts in view per frame")
+    finally:
+        classes.time = real_time
+
+
+def makeAssetSource(num_types: int) -> dict:
+    """ Creates asset source definitions for num_types ghost types, each with its own palette and 8x8 sprites. """
+    source = {"palettes": {}, "sprites": {}, "ghost_types": {}, "spawn_tables": {}}
+    for i in range(num_types):
+        source["palettes"][f"palette_{i}"] = [[random.randrange(256) for _ in range(3)] for _ in range(16)]
+        sprite_names = []
+        for state in ("idle", "passive", "panicked"):
+            sprite_names.append(f"ghost_{i}_{state}")
+            source["sprites"][sprite_names[-1]] = {
+                "palette": f"palette_{i}",
+                "rows": ["".join(random.choice("0123456789abcdef") for _ in range(8)) for _ in range(8)],
+            }
+        source["ghost_types"][f"ghost_{i}"] = {
+            "sprites": sprite_names, "passive_step": 2, "panicked_step": 5, "passive_move_delay": 1,
+            "panicked_move_delay": 0.1, "max_health": 10, "panic_threshold": 1,
+        }
+    source["spawn_tables"]["1"] = {f"ghost_{i}": 1 for i in range(num_types)}
+    return source
+
+
+def benchmarkAssets(num_types=5000, lookups=10000, hot_types=50):
+    """ Compares loading ghost types from JSON source with opening a compiled asset pack, then measures looking up
+    ghost types in the pack, mostly from a small set of hot types.
+    """
+    source_text = json.dumps(makeAssetSource(num_types))
+    data = compileAssets(json.loads(source_text))
+
+    with TemporaryDirectory() as directory:
+        path = os.path.join(directory, "world.gpak")
+        writeAtomically(path, data)
+
+        parse_time = timeIt(lambda: json.loads(source_text), repeats=3)
+        open_time = timeIt(lambda: AssetPack(path).close())
+
+        pack = AssetPack(path, cache_size=64 * 1024)
+        names = [f"ghost_{i}" for i in range(num_types)]
+        start = perf_counter()
+        for name in names:
+            pack.getGhostType(name)
+        cold_time = (perf_counter() - start) / num_types
+
+        # Mostly hot types, with the occasional cold one
+        picks = [names[random.randrange(hot_types)] if random.random() < 0.95 else random.choice(names)
+                 for _ in range(lookups)]
+        start = perf_counter()
+        for name in picks:
+            pack.getGhostType(name)
+        mixed_time = (perf_counter() - start) / lookups
+        cache = pack.cache
+        pack.close()
+
+    print(f"{num_types} ghost types: source {len(source_text)} bytes, pack {len(data)} bytes")
+    print(f"  parse source {parse_time * 1000:.1f} ms, open pack {open_time * 1e6:.0f} us")
+    print(f"  first lookup {cold_time * 1e6:.1f} us, mostly hot lookups {mixed_time * 1e6:.1f} us; cache holds "
+          f"{len(cache.assets)} assets in {cache.size} bytes, {cache.hits} hits, {cache.misses} misses, "
+          f"{cache.evictions} evictions")
+
+
+def benchmarkSharedState(num_readers=4, duration=1.0):
+    """ Measures how many orientation reads reader threads manage while the sampler publishes at its interval, and the
+    contention seen by the sampler and joystick reader.
+    """
+    sense_ref = SenseHatRef(StandInSenseHat())
+    reads = [0] * num_readers
+
+    def read(i):
+        end = perf_counter() + duration
+        while perf_counter() < end:
+            sense_ref.orientation_degrees["yaw"]
+            reads[i] += 1
+
+    readers = [Thread(target=read, args=(i,)) for i in range(num_readers)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    sense_ref.reset(StandInSenseHat())
+    sense_ref.stop()
+
+    print(f"{num_readers} readers: {sum(reads) / duration:.0f} reads per second, "
+          f"{sense_ref.sampler.iterations / duration:.0f} orientations published per second")
+    print(f"  publish lock: {sense_ref.orientation.publish_lock.stats}")
+    print(f"  events lock: {sense_ref.events_lock.stats}")
+
+
+BENCHMARKS = {
+    "snapshot": benchmarkSnapshot,
+    "ghost_types": benchmarkGhostTypes,
+    "movement": benchmarkMovement,
+    "render": benchmarkRender,
+    "scheduler": benchmarkScheduler,
+    "scheduler_events": benchmarkSchedulerEvents,
+    "assets": benchmarkAssets,
+    "shared_state": benchmarkSharedState,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,61 @@
+import argparse
+import os
+
+from library.capture import ApngWriter, readCapture, upscale, encodePng
+
+# Converts a capture recorded by FrameCapture into images for review, e.g.
+# `python capture_tool.py capture.gcap frames/` or `python capture_tool.py capture.gcap capture.png --animated`.
+
+parser = argparse.ArgumentParser(description="Convert an LED matrix capture into PNG images.")
+parser.add_argument("capture", help="capture file to read")
+parser.add_argument("output", help="directory to write a PNG per frame to, or the file to write an animation to")
+parser.add_argument("--scale", type=int, default=32, help="size in pixels of each LED")
+parser.add_argument("--animated", action="store_true", help="write one animated PNG instead of a PNG per frame")
+parser.add_argument("--first", type=int, default=0, help="index of the first frame to convert")
+parser.add_argument("--count", type=int, default=None, help="number of frames to convert; defaults to all")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    # Frames are converted as they are read, so only one is held at a time however long the capture is
+    def selectFrames():
+        """ Yields (index, time captured, frame) for each frame chosen by --first and --count. """
+        last = None if args.count is None else args.first + args.count
+        for i, (timestamp, frame) in enumerate(readCapture(args.capture)):
+            if last is not None and i >= last:
+                break
+            if i >= args.first:
+                yield i, timestamp, frame
+
+    num_converted = 0
+    try:
+        if args.animated:
+            with open(args.output, "wb") as file:
+                writer = ApngWriter(file)
+                # Show each frame until the next was captured, so a frame is written once the next is read; the last
+                # frame has no next, so reuses the previous delay
+                previous = None
+                delay = 0.1
+                for _, timestamp, frame in selectFrames():
+                    if previous is not None:
+                        delay = timestamp - previous[0]
+                        writer.addFrame(upscale(previous[1], args.scale), delay)
+                    previous = (timestamp, frame)
+                if previous is not None:
+                    writer.addFrame(upscale(previous[1], args.scale), delay)
+                num_converted = writer.num_frames
+                if num_converted:
+                    writer.close()
+            if not num_converted:
+                os.remove(args.output)
+                parser.error("No frames were selected to animate.")
+        else:
+            os.makedirs(args.output, exist_ok=True)
+            for i, _, frame in selectFrames():
+                with open(os.path.join(args.output, f"frame_{i:06d}.png"), "wb") as file:
+                    file.write(encodePng(upscale(frame, args.scale)))
+                num_converted += 1
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Converted {num_converted} frames")
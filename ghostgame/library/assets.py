@@ -0,0 +1,482 @@
+import mmap
+import os
+import random
+from math import isfinite
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+from .constants import AssetKind, GhostState, ASSET_CACHE_SIZE
+from .ghosttypes import GHOST_TYPES, GhostType, BASIC, getGhostTypeId
+
+""" Asset pack format (all values little endian)
+
+Header:
+    magic (4 bytes), version (uint16), number of entries (uint32), length of name table (uint32)
+
+Directory, one record per entry, sorted by kind and then by name so that entries can be found by binary search:
+    kind (uint8, an AssetKind), offset of name in name table (uint32), length of name (uint16),
+    offset of data from the start of the file (uint32), length of data (uint32)
+
+Name table:
+    The UTF-8 names of every entry, one after another. Spawn tables are named by their dimension.
+
+Then the data of each entry, by kind; names within data are a length (uint8) followed by UTF-8:
+    PALETTE: the colors (uint8 x3 each)
+    SPRITE: width (uint8), height (uint8), palette name, then the palette index of each pixel row by row (uint8 each)
+    GHOST_TYPE: passive and panicked step (int16 x2), passive and panicked move delay (float64 x2),
+        max health (float64), panic threshold (float64), centre (uint8 x2), then a sprite name for each GhostState
+    SPAWN_TABLE: number of rows (uint16), then for each row: weight (float64), ghost type name
+
+Nothing is parsed when a pack is opened beyond the header; the directory is read straight from the mapped file.
+"""
+
+ASSET_PACK_MAGIC = b"GPAK"
+ASSET_PACK_VERSION = 1
+
+_HEADER = struct.Struct("<4sHII")
+_ENTRY = np.dtype([("kind", "<u1"), ("name_offset", "<u4"), ("name_length", "<u2"), ("offset", "<u4"),
+                   ("length", "<u4")])
+# The same record, for reading single entries faster than through numpy
+_ENTRY_STRUCT = struct.Struct("<BIHII")
+_SPRITE = struct.Struct("<BB")
+_GHOST_TYPE = struct.Struct("<hhddddBB")
+_SPAWN_TABLE = struct.Struct("<H")
+_SPAWN_ROW = struct.Struct("<d")
+
+_SOURCE_SECTIONS = ("palettes", "sprites", "ghost_types", "spawn_tables")
+
+
+def _packName(name: str) -> bytes:
+    encoded = name.encode()
+    if len(encoded) > 255:
+        raise ValueError(f"Name {name} is too long.")
+    return bytes((len(encoded),)) + encoded
+
+
+def _unpackName(data, offset: int) -> tuple:
+    """ Returns (the name at offset, the offset after it). """
+    end = offset + 1 + data[offset]
+    return data[offset + 1:end].decode(), end
+
+
+def _require(definition: dict, key: str, description: str):
+    """ Gets a field of an asset definition, raising a ValueError naming the asset if it is missing. """
+    if key not in definition:
+        raise ValueError(f"{description} has no {key}.")
+    return definition[key]
+
+
+def _isInteger(value) -> bool:
+    # JSON true and false load as bools, which are also ints
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _requireNumber(definition: dict, key: str, description: str, minimum: float, maximum=float("inf"),
+                   integer=False, exclusive=False):
+    """ Gets a numeric field of an asset definition, raising a ValueError naming the asset if it is missing, of the
+    wrong type, or out of range (above minimum if exclusive, otherwise at least minimum; at most maximum).
+    """
+    value = _require(definition, key, description)
+    if not (_isInteger(value) or (not integer and isinstance(value, float) and isfinite(value))):
+        raise ValueError(f"{description} has a {key} that is not {'an integer' if integer else 'a finite number'}.")
+    if value < minimum or (exclusive and value == minimum) or value > maximum:
+        raise ValueError(f"{description} has a {key} of {value}, out of range.")
+    return value
+
+
+# Sprites hold one hex digit per pixel, so palettes can be no longer than this
+MAX_PALETTE_COLORS = 16
+
+
+def _compilePalette(name: str, colors: list) -> bytes:
+    if not isinstance(colors, list) or not 0 < len(colors) <= MAX_PALETTE_COLORS:
+        raise ValueError(f"Palette {name} must be a list of between 1 and {MAX_PALETTE_COLORS} colors.")
+    if any(not isinstance(color, list) or len(color) != 3 or
+           not all(_isInteger(value) and 0 <= value <= 255 for value in color) for color in colors):
+        raise ValueError(f"Palette {name} has a color that is not three integers from 0 to 255.")
+    return np.array(colors, dtype=np.uint8).tobytes()
+
+
+def _compileSprite(name: str, sprite: dict, palettes: dict) -> bytes:
+    description = f"Sprite {name}"
+    if not isinstance(sprite, dict):
+        raise ValueError(f"{description} is not an object.")
+    palette = _require(sprite, "palette", description)
+    rows = _require(sprite, "rows", description)
+    if not isinstance(palette, str) or palette not in palettes:
+        raise ValueError(f"{description} uses unknown palette {palette}.")
+    if not isinstance(rows, list) or not all(isinstance(row, str) for row in rows):
+        raise ValueError(f"{description} must have a list of rows, each a string.")
+    if not rows or not rows[0] or any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError(f"{description} must have rows of equal, non zero length.")
+    if len(rows) > 255 or len(rows[0]) > 255:
+        raise ValueError(f"{description} is larger than 255x255.")
+
+    # Each character of a row is the index of the pixel's color in the palette, in hex
+    try:
+        indices = [int(char, 16) for row in rows for char in row]
+    except ValueError:
+        raise ValueError(f"{description} has a pixel that is not a hex digit.") from None
+    if max(indices) >= len(palettes[palette]):
+        raise ValueError(f"{description} uses a color beyond the end of palette {palette}.")
+
+    return _SPRITE.pack(len(rows[0]), len(rows)) + _packName(palette) + bytes(indices)
+
+
+def _compileGhostType(name: str, ghost_type: dict, sprites: dict) -> bytes:
+    description = f"Ghost type {name}"
+    if not isinstance(ghost_type, dict):
+        raise ValueError(f"{description} is not an object.")
+    if name in (registered.name for registered in GHOST_TYPES):
+        raise ValueError(f"{description} is already built in.")
+
+    sprite_names = _require(ghost_type, "sprites", description)
+    if not isinstance(sprite_names, list) or len(sprite_names) != len(GhostState):
+        raise ValueError(f"{description} needs a sprite for each GhostState.")
+    for sprite_name in sprite_names:
+        if not isinstance(sprite_name, str) or sprite_name not in sprites:
+            raise ValueError(f"{description} uses unknown sprite {sprite_name}.")
+
+    # Steps are packed as int16; delays must be positive, or the ghost would move every frame
+    fields = [_requireNumber(ghost_type, "passive_step", description, 0, 0x7fff, integer=True),
+              _requireNumber(ghost_type, "panicked_step", description, 0, 0x7fff, integer=True),
+              _requireNumber(ghost_type, "passive_move_delay", description, 0, exclusive=True),
+              _requireNumber(ghost_type, "panicked_move_delay", description, 0, exclusive=True),
+              _requireNumber(ghost_type, "max_health", description, 0, exclusive=True),
+              _requireNumber(ghost_type, "panic_threshold", description, 0)]
+
+    # The centre must be a pixel within every sprite of the type
+    centre = ghost_type.get("centre", [0, 0])
+    if not isinstance(centre, list) or len(centre) != 2 or not all(_isInteger(value) for value in centre):
+        raise ValueError(f"{description} has a centre that is not two integers.")
+    for sprite_name in sprite_names:
+        rows = sprites[sprite_name]["rows"]
+        if not (0 <= centre[0] < len(rows[0]) and 0 <= centre[1] < len(rows)):
+            raise ValueError(f"{description} has a centre outside of sprite {sprite_name}.")
+
+    return _GHOST_TYPE.pack(*fields, *centre) + b"".join(_packName(sprite_name) for sprite_name in sprite_names)
+
+
+def _compileSpawnTable(dimension: str, table: dict, ghost_types: dict) -> bytes:
+    description = f"Spawn table of dimension {dimension}"
+    if not dimension.isdigit():
+        raise ValueError(f"{description} must be named by a dimension number.")
+    if not isinstance(table, dict) or not table:
+        raise ValueError(f"{description} must be a non empty object.")
+    if len(table) > 0xffff:
+        raise ValueError(f"{description} has more than {0xffff} rows.")
+
+    rows = [_SPAWN_TABLE.pack(len(table))]
+    for type_name in table:
+        if type_name not in ghost_types and type_name not in (registered.name for registered in GHOST_TYPES):
+            raise ValueError(f"{description} uses unknown ghost type {type_name}.")
+        weight = table[type_name]
+        if not (_isInteger(weight) or (isinstance(weight, float) and isfinite(weight))) or not weight > 0:
+            raise ValueError(f"{description} has a weight for {type_name} that is not a positive number.")
+        rows.append(_SPAWN_ROW.pack(weight) + _packName(type_name))
+    return b"".join(rows)
+
+
+def compileAssets(source: dict) -> bytes:
+    """ Packs readable asset definitions into an asset pack; see assets/world.json for the source format.
+
+    Args:
+        source: The definitions, as loaded from JSON: a dict of sections (palettes, sprites, ghost_types and
+            spawn_tables), each a dict of assets by name.
+
+    Returns:
+        bytes: The asset pack.
+
+    Raises:
+        ValueError: If an asset is malformed, or refers to an asset that does not exist.
+    """
+    for section, assets in source.items():
+        if section not in _SOURCE_SECTIONS:
+            raise ValueError(f"Unknown section {section}.")
+        if not isinstance(assets, dict):
+            raise ValueError(f"Section {section} is not an object.")
+    palettes = source.get("palettes", {})
+    sprites = source.get("sprites", {})
+    ghost_types = source.get("ghost_types", {})
+    spawn_tables = source.get("spawn_tables", {})
+
+    entries = [(AssetKind.PALETTE, name, _compilePalette(name, colors)) for name, colors in palettes.items()]
+    entries += [(AssetKind.SPRITE, name, _compileSprite(name, sprite, palettes)) for name, sprite in sprites.items()]
+    entries += [(AssetKind.GHOST_TYPE, name, _compileGhostType(name, ghost_type, sprites))
+                for name, ghost_type in ghost_types.items()]
+    entries += [(AssetKind.SPAWN_TABLE, dimension, _compileSpawnTable(dimension, table, ghost_types))
+                for dimension, table in spawn_tables.items()]
+    # Sorted in the order AssetPack.findEntry searches in
+    entries.sort(key=lambda entry: (entry[0], entry[1].encode()))
+
+    names = [name.encode() for _, name, _ in entries]
+    names_length = sum(len(name) for name in names)
+    directory = np.zeros(len(entries), dtype=_ENTRY)
+
+    name_offset = 0
+    offset = _HEADER.size + directory.nbytes + names_length
+    for record, (kind, _, data), name in zip(directory, entries, names):
+        record["kind"] = kind
+        record["name_offset"] = name_offset
+        record["name_length"] = len(name)
+        record["offset"] = offset
+        record["length"] = len(data)
+        name_offset += len(name)
+        offset += len(data)
+
+    chunks = [_HEADER.pack(ASSET_PACK_MAGIC, ASSET_PACK_VERSION, len(entries), names_length), directory.tobytes()]
+    chunks += names
+    chunks += [data for _, _, data in entries]
+    return b"".join(chunks)
+
+
+class AssetCache:
+    """ Keeps recently used decoded assets, dropping the least recently used once the total packed size of the assets
+    kept goes over a limit; the memory taken by a decoded asset grows with its packed size.
+
+    Attributes:
+        max_size (int): The greatest total packed size in bytes of the assets to keep.
+        size (int): The total packed size in bytes of the assets kept.
+        assets (OrderedDict): Maps (AssetKind, name) to (decoded asset, packed size), least recently used first.
+        hits (int): The number of times an asset was found in the cache.
+        misses (int): The number of times an asset had to be decoded.
+        evictions (int): The number of assets dropped to stay under max_size.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.assets = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple):
+        """ Returns a cached asset, or None if it is not cached. """
+        cached = self.assets.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+
+        self.assets.move_to_end(key)
+        self.hits += 1
+        return cached[0]
+
+    def put(self, key: tuple, asset, size: int):
+        """ Caches an asset, dropping the least recently used assets if needed; the newest asset is always kept. """
+        self.assets[key] = (asset, size)
+        self.size += size
+
+        while self.size > self.max_size and len(self.assets) > 1:
+            _, (_, dropped_size) = self.assets.popitem(last=False)
+            self.size -= dropped_size
+            self.evictions += 1
+
+
+class AssetPack:
+    """ Reads the assets in an asset pack made by compileAssets. The file is memory mapped rather than read, and each
+    asset is only decoded the first time it is used, so opening even a large pack takes no time; decoded assets are
+    kept in a bounded cache.
+
+    Decoded sprites and ghost types are plain tuples, as if they had been written in ghosttypes.py.
+
+    Attributes:
+        path (str): The asset pack file.
+        file: The asset pack file, open while it is mapped.
+        data (mmap.mmap): The contents of the file, mapped into memory.
+        entries (np.ndarray): The directory, read straight from the mapped file.
+        names_offset (int): Where the name table starts in the file.
+        cache (AssetCache): The decoded assets used recently.
+    """
+
+    def __init__(self, path: str, cache_size=ASSET_CACHE_SIZE):
+        """
+        Args:
+            path: The asset pack file to open.
+            cache_size: The greatest total packed size in bytes of decoded assets to keep cached.
+
+        Raises:
+            ValueError: If the file is not an asset pack, was made by an unsupported version, or is truncated; the
+                file is closed again.
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = None
+        self.entries = None
+
+        try:
+            # Empty files cannot be mapped, so check the size first
+            size = os.fstat(self.file.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError(f"{path} is too short to be an asset pack.")
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, num_entries, names_length = _HEADER.unpack_from(self.data)
+            if magic != ASSET_PACK_MAGIC:
+                raise ValueError(f"{path} is not an asset pack.")
+            if version != ASSET_PACK_VERSION:
+                raise ValueError(f"Unsupported asset pack version {version}.")
+
+            # The directory, name table and the data of every entry must all be within the file
+            self.names_offset = _HEADER.size + num_entries * _ENTRY.itemsize
+            if self.names_offset + names_length > size:
+                raise ValueError(f"{path} is truncated.")
+            self.entries = np.frombuffer(self.data, dtype=_ENTRY, count=num_entries, offset=_HEADER.size)
+            if num_entries and (self.entries["offset"].astype(np.uint64) + self.entries["length"]).max() > size:
+                raise ValueError(f"{path} is truncated.")
+        except ValueError:
+            self.close()
+            raise
+
+        self.cache = AssetCache(cache_size)
+
+        self.decoders = {
+            AssetKind.PALETTE: self.decodePalette,
+            AssetKind.SPRITE: self.decodeSprite,
+            AssetKind.GHOST_TYPE: self.decodeGhostType,
+            AssetKind.SPAWN_TABLE: self.decodeSpawnTable,
+        }
+
+    def close(self):
+        """ Unmaps and closes the file; assets already decoded can still be used. """
+        # The directory views the mapped memory, so must be let go of before unmapping
+        self.entries = None
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+    def readEntry(self, i: int) -> tuple:
+        """ Returns the (kind, name offset, name length, data offset, data length) of an entry in the directory. """
+        return _ENTRY_STRUCT.unpack_from(self.data, _HEADER.size + i * _ENTRY_STRUCT.size)
+
+    def entryKey(self, i: int) -> tuple:
+        """ Returns the (kind, encoded name) of an entry in the directory, which is sorted by these. """
+        kind, name_offset, name_length, _, _ = self.readEntry(i)
+        start = self.names_offset + name_offset
+        return kind, self.data[start:start + name_length]
+
+    def findEntry(self, kind: AssetKind, name: str):
+        """ Finds an entry in the directory by binary search.
+
+        Returns:
+            int: The index of the entry, or None if there is no such asset.
+        """
+        key = (kind, name.encode())
+        low, high = 0, len(self.entries)
+        while low < high:
+            middle = (low + high) // 2
+            if self.entryKey(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < len(self.entries) and self.entryKey(low) == key:
+            return low
+        return None
+
+    def hasAsset(self, kind: AssetKind, name: str) -> bool:
+        return self.findEntry(kind, name) is not None
+
+    def listAssets(self, kind: AssetKind) -> list:
+        """ Returns the names of every asset of some kind. """
+        return [self.entryKey(i)[1].decode() for i in np.flatnonzero(self.entries["kind"] == kind).tolist()]
+
+    def getAsset(self, kind: AssetKind, name: str):
+        """ Returns an asset, decoding it if it is not cached.
+
+        Raises:
+            ValueError: If there is no such asset.
+        """
+        key = (kind, name)
+        asset = self.cache.get(key)
+        if asset is not None:
+            return asset
+
+        i = self.findEntry(kind, name)
+        if i is None:
+            raise ValueError(f"Asset pack {self.path} has no {kind.name.lower()} {name}.")
+        _, _, _, offset, length = self.readEntry(i)
+        asset = self.decoders[kind](name, offset, length)
+        self.cache.put(key, asset, length)
+        return asset
+
+    def decodePalette(self, name: str, offset: int, length: int) -> tuple:
+        """ Decodes a palette into a tuple of (R, G, B) tuples. """
+        colors = np.frombuffer(self.data, dtype=np.uint8, count=length, offset=offset).reshape(-1, 3)
+        return tuple(tuple(color) for color in colors.tolist())
+
+    def decodeSprite(self, name: str, offset: int, length: int) -> tuple:
+        """ Decodes a sprite into a 2D tuple [y][x] of (R, G, B) tuples. """
+        width, height = _SPRITE.unpack_from(self.data, offset)
+        palette_name, offset = _unpackName(self.data, offset + _SPRITE.size)
+        palette = self.getAsset(AssetKind.PALETTE, palette_name)
+
+        indices = np.frombuffer(self.data, dtype=np.uint8, count=width * height, offset=offset)
+        if indices.max() >= len(palette):
+            raise ValueError(f"Sprite {name} uses a color beyond the end of palette {palette_name}.")
+        return tuple(tuple(palette[index] for index in row) for row in indices.reshape(height, width).tolist())
+
+    def decodeGhostType(self, name: str, offset: int, length: int) -> GhostType:
+        (passive_step, panicked_step, passive_move_delay, panicked_move_delay, max_health, panic_threshold,
+         centre_x, centre_y) = _GHOST_TYPE.unpack_from(self.data, offset)
+
+        offset += _GHOST_TYPE.size
+        sprites = []
+        for _ in GhostState:
+            sprite_name, offset = _unpackName(self.data, offset)
+            sprites.append(self.getAsset(AssetKind.SPRITE, sprite_name))
+
+        return GhostType(name=name, sprites=tuple(sprites), centre=(centre_x, centre_y), passive_step=passive_step,
+                         panicked_step=panicked_step, passive_move_delay=passive_move_delay,
+                         panicked_move_delay=panicked_move_delay, max_health=max_health,
+                         panic_threshold=panic_threshold)
+
+    def decodeSpawnTable(self, name: str, offset: int, length: int) -> tuple:
+        """ Decodes a spawn table into a tuple of (ghost type name, weight) tuples. """
+        num_rows, = _SPAWN_TABLE.unpack_from(self.data, offset)
+        offset += _SPAWN_TABLE.size
+
+        rows = []
+        for _ in range(num_rows):
+            weight, = _SPAWN_ROW.unpack_from(self.data, offset)
+            type_name, offset = _unpackName(self.data, offset + _SPAWN_ROW.size)
+            rows.append((type_name, weight))
+        return tuple(rows)
+
+    def getPalette(self, name: str) -> tuple:
+        return self.getAsset(AssetKind.PALETTE, name)
+
+    def getSprite(self, name: str) -> tuple:
+        return self.getAsset(AssetKind.SPRITE, name)
+
+    def hasGhostType(self, name: str) -> bool:
+        return self.hasAsset(AssetKind.GHOST_TYPE, name)
+
+    def getGhostType(self, name: str) -> GhostType:
+        """ Returns a ghost type, without registering it; see ghosttypes.mountAssetPack. """
+        return self.getAsset(AssetKind.GHOST_TYPE, name)
+
+    def getSpawnTable(self, dimension: int) -> tuple:
+        return self.getAsset(AssetKind.SPAWN_TABLE, str(dimension))
+
+    def pickGhostType(self, dimension: int, rng=random, default=BASIC) -> int:
+        """ Picks the type of a ghost to spawn in some dimension, weighted by the dimension's spawn table. Types are
+        found as in getGhostTypeId, so the pack should be mounted if its spawn tables use its own ghost types.
+
+        Args:
+            dimension: The dimension the ghost will spawn in.
+            rng: The random number generator to pick with, e.g. a seeded random.Random.
+            default: The type id to use if the pack has no spawn table for the dimension.
+
+        Returns:
+            int: The type id.
+        """
+        if not self.hasAsset(AssetKind.SPAWN_TABLE, str(dimension)):
+            return default
+
+        table = self.getSpawnTable(dimension)
+        type_name = rng.choices([type_name for type_name, _ in table], weights=[weight for _, weight in table])[0]
+        return getGhostTypeId(type_name)
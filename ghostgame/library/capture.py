@@ -0,0 +1,283 @@
+import struct
+import zlib
+from threading import Event
+from time import time
+
+import numpy as np
+
+from .concurrency import Worker
+
+""" Capture file format (all values little endian)
+
+Header:
+    magic (4 bytes), version (uint16), width (uint16), height (uint16)
+
+Then one record per frame:
+    time captured (float64), number of pixels changed since the previous frame (uint32),
+    the index of each changed pixel (uint32 each), then the new color of each changed pixel (uint8 x3 each).
+
+The frame before the first record is treated as blank.
+"""
+
+CAPTURE_MAGIC = b"GCAP"
+CAPTURE_VERSION = 2
+
+_HEADER = struct.Struct("<4sHHH")
+_RECORD = struct.Struct("<dI")
+
+
+class FrameCapture:
+    """ Records each frame shown on the LED matrix into a preallocated ring buffer, which is written to a capture file
+    on a background worker. Capturing a frame is only a copy into the buffer, so it can be left on during play.
+
+    Attributes:
+        path (str): The file the capture is written to.
+        width (int): The width of each frame in pixels.
+        height (int): The height of each frame in pixels.
+        frames (np.ndarray): The ring buffer of frames, of shape (capacity, width * height, 3).
+        timestamps (np.ndarray): The time (since epoch) each frame in the ring buffer was captured.
+        flush_size (int): How many frames to wait for before waking the writer.
+        num_captured (int): The total number of frames captured.
+        num_written (int): The total number of frames the writer has taken from the ring buffer.
+        num_dropped (int): The number of frames overwritten before the writer could take them.
+        wake (Event): Set when there are frames to write, or the writer should stop.
+        writer (Worker): Writes captured frames; started in constructor. If it stops because of an error, the error is
+            raised again by capture and close.
+    """
+
+    def __init__(self, path: str, width=8, height=8, capacity=256, flush_size=32):
+        self.path = path
+        self.width = width
+        self.height = height
+
+        self.frames = np.zeros((capacity, width * height, 3), dtype=np.uint8)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.flush_size = flush_size
+
+        self.num_captured = 0
+        self.num_written = 0
+        self.num_dropped = 0
+
+        # Write the header now, so a capture file exists even if no frames are written
+        self.file = open(path, "wb")
+        self.file.write(_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, width, height))
+        self.previous = np.zeros((width * height, 3), dtype=np.uint8)
+
+        self.wake = Event()
+        self.writer = Worker("capture writer", self.waitAndWrite)
+        self.writer.start()
+
+    def capture(self, pixels: list):
+        """ Copies a frame into the ring buffer.
+
+        Args:
+            pixels: The frame, as a list of width * height lists of three values (R, G, B), or an equivalent array.
+
+        Raises:
+            ValueError: If the frame is not width * height pixels.
+            RuntimeError: If the writer has stopped because of an error.
+        """
+        self.checkWriter()
+
+        frame = np.asarray(pixels)
+        if frame.shape[-1:] != (3,) or frame.size != self.frames[0].size:
+            raise ValueError(f"Expected a frame of {self.width}x{self.height} pixels of (R, G, B), got shape "
+                             f"{frame.shape}.")
+
+        slot = self.num_captured % len(self.frames)
+        self.frames[slot] = frame.reshape(-1, 3)
+        self.timestamps[slot] = time()
+        self.num_captured += 1
+
+        if self.num_captured - self.num_written >= self.flush_size:
+            self.wake.set()
+
+    def checkWriter(self):
+        """ Raises a RuntimeError if the writer has stopped because of an error. """
+        if self.writer.error is not None:
+            raise RuntimeError(f"Writing capture {self.path} failed.") from self.writer.error
+
+    def waitAndWrite(self):
+        """ Waits until enough frames are captured, or the writer is stopped, then writes them. """
+        self.wake.wait()
+        self.wake.clear()
+        self.writeFrames()
+
+    def writeFrames(self):
+        """ Delta encodes the frames captured since the last call, and appends them to the capture file. """
+        capacity = len(self.frames)
+        end = self.num_captured
+        start = max(self.num_written, end - capacity)
+        self.num_dropped += start - self.num_written
+
+        # Copy the frames out first, so the game can carry on capturing into the ring buffer
+        slots = np.arange(start, end) % capacity
+        frames = self.frames[slots]
+        timestamps = self.timestamps[slots]
+        self.num_written = end
+
+        # Any frames overwritten while copying are dropped
+        overwritten = min(end - start, max(0, self.num_captured - capacity - start))
+        if overwritten:
+            frames = frames[overwritten:]
+            timestamps = timestamps[overwritten:]
+            self.num_dropped += overwritten
+
+        records = []
+        for frame, timestamp in zip(frames, timestamps):
+            changed = np.flatnonzero((frame != self.previous).any(axis=1)).astype(np.uint32)
+            records.append(_RECORD.pack(timestamp, len(changed)))
+            records.append(changed.tobytes())
+            records.append(frame[changed].tobytes())
+            self.previous = frame
+
+        self.file.write(b"".join(records))
+        self.file.flush()
+
+    def close(self):
+        """ Stops the writer, writes any remaining frames, and closes the file.
+
+        Raises:
+            RuntimeError: If the writer stopped because of an error, in which case frames may be missing.
+        """
+        self.writer.stop()
+        self.wake.set()
+        self.writer.join()
+        try:
+            self.checkWriter()
+            self.writeFrames()
+        finally:
+            self.file.close()
+
+
+def readCapture(path: str):
+    """ Reads the frames of a capture file.
+
+    Args:
+        path: The capture file to read.
+
+    Yields:
+        tuple: (time captured, frame as an array of shape (height, width, 3)) for each frame.
+
+    Raises:
+        ValueError: If the file is not a capture, or was made by an unsupported version.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    if len(data) < _HEADER.size:
+        raise ValueError("File is too short to be a capture.")
+    magic, version, width, height = _HEADER.unpack_from(data)
+    if magic != CAPTURE_MAGIC:
+        raise ValueError("File is not a capture.")
+    if version != CAPTURE_VERSION:
+        raise ValueError(f"Unsupported capture version {version}.")
+
+    frame = np.zeros((width * height, 3), dtype=np.uint8)
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(data):
+        timestamp, num_changed = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+
+        # Stop at a record cut short, e.g. by the Pi losing power
+        if offset + num_changed * 7 > len(data):
+            break
+
+        changed = np.frombuffer(data, dtype=np.uint32, count=num_changed, offset=offset)
+        offset += num_changed * 4
+        colors = np.frombuffer(data, dtype=np.uint8, count=num_changed * 3, offset=offset)
+        offset += num_changed * 3
+
+        frame[changed] = colors.reshape(-1, 3)
+        yield timestamp, frame.reshape(height, width, 3).copy()
+
+
+def upscale(frame: np.ndarray, scale: int) -> np.ndarray:
+    """ Enlarges a frame so that each LED becomes a square of scale x scale pixels. """
+    return frame.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+def _pngChunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def _pngImageData(image: np.ndarray) -> bytes:
+    """ Compresses an image into PNG image data, with no filtering. """
+    rows = np.concatenate((np.zeros((image.shape[0], 1), dtype=np.uint8), image.reshape(image.shape[0], -1)), axis=1)
+    return zlib.compress(rows.tobytes())
+
+
+def _pngHeader(image: np.ndarray) -> bytes:
+    height, width = image.shape[:2]
+    # 8 bits per channel, truecolor, default compression, filtering and no interlacing
+    return b"\x89PNG\r\n\x1a\n" + _pngChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+
+def encodePng(image: np.ndarray) -> bytes:
+    """ Encodes an RGB image of shape (height, width, 3) as a PNG. """
+    return _pngHeader(image) + _pngChunk(b"IDAT", _pngImageData(image)) + _pngChunk(b"IEND", b"")
+
+
+class ApngWriter:
+    """ Writes an animated PNG that loops forever one frame at a time, so that long animations are never held in
+    memory. The file must be seekable, as the number of frames is only written once the last frame is added.
+
+    Attributes:
+        file: The binary file to write to.
+        shape (tuple): The shape of every frame, set by the first frame; None until then.
+        num_frames (int): The number of frames written.
+        sequence (int): The sequence number of the next fcTL or fdAT chunk, which share one sequence.
+        actl_offset (int): Where the acTL chunk, which holds the number of frames, starts in the file.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.shape = None
+        self.num_frames = 0
+        self.sequence = 0
+        self.actl_offset = None
+
+    def addFrame(self, image: np.ndarray, delay: float):
+        """ Writes a frame of the animation.
+
+        Args:
+            image: The frame, as an RGB image of shape (height, width, 3); every frame must have the same shape.
+            delay: How long to show the frame for, in seconds.
+        """
+        if self.shape is None:
+            self.shape = image.shape
+            self.file.write(_pngHeader(image))
+            # Rewritten by close once the number of frames is known
+            self.actl_offset = self.file.tell()
+            self.file.write(_pngChunk(b"acTL", struct.pack(">II", 0, 0)))
+        elif image.shape != self.shape:
+            raise ValueError(f"Frame of shape {image.shape} does not match the first frame's {self.shape}.")
+
+        height, width = self.shape[:2]
+        delay_ms = min(65535, max(0, round(delay * 1000)))
+        self.file.write(_pngChunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, width, height, 0, 0,
+                                                       delay_ms, 1000, 0, 0)))
+        self.sequence += 1
+
+        # The first frame doubles as the still image for viewers without animation support
+        if self.num_frames == 0:
+            self.file.write(_pngChunk(b"IDAT", _pngImageData(image)))
+        else:
+            self.file.write(_pngChunk(b"fdAT", struct.pack(">I", self.sequence) + _pngImageData(image)))
+            self.sequence += 1
+        self.num_frames += 1
+
+    def close(self):
+        """ Finishes the animation, filling in the number of frames; the file itself is left open.
+
+        Raises:
+            ValueError: If no frames were added, as an animated PNG needs at least one.
+        """
+        if self.num_frames == 0:
+            raise ValueError("An animated PNG needs at least one frame.")
+
+        self.file.write(_pngChunk(b"IEND", b""))
+        end = self.file.tell()
+        self.file.seek(self.actl_offset)
+        self.file.write(_pngChunk(b"acTL", struct.pack(">II", self.num_frames, 0)))
+        self.file.seek(end)
@@ -2,12 +2,22 @@ import warnings
 from random import randint
 from time import time
 from math import floor
-from threading import Thread, Lock
+from types import MappingProxyType
 
-from .constants import NUM_DIMS, RGB, RANGE, StickDir, StickAct, HUDState, GameState
-from .sensehat import calcXAngularDisp, calcYAngularDisp, calcDist, calcPxlPos
+import numpy as np
 
-from sense_hat import SenseHat, InputEvent
+from .concurrency import SnapshotCell, InstrumentedLock, Worker
+from .constants import NUM_DIMS, RGB, StickDir, StickAct, HUDState, GameState, GhostState, JOYSTICK_POLL_INTERVAL, \
+    ORIENTATION_SAMPLE_INTERVAL, WORKER_STOP_TIMEOUT, DISPLAY
+from .display import DisplayGeometry, FrameBuffer, makeDisplay
+from .ghosttypes import GHOST_TYPES, BASIC
+from .sensehat import calcXAngularDisp, calcYAngularDisp, calcDist
+
+# The sense HAT library is only available on the Pi; stand-in hardware can be passed to GameManager elsewhere.
+try:
+    from sense_hat import SenseHat, InputEvent
+except ImportError:
+    SenseHat = InputEvent = None
 
 
 class NotImplementedWarning(Warning):
@@ -20,31 +30,113 @@ def warnNYI(msg=""):
 
 
 class SenseHatRef:
-    """ Stores a reference to the senseHAT and continually updates the orientation via a thread.
+    """ Stores a reference to the senseHAT, and reads its orientation and joystick on background workers.
+
+    The orientation is published as an immutable snapshot, so the game loop and ghosts can read it without locking,
+    and joystick events are queued until the game loop collects them.
 
     Attributes:
         sense_hat (SenseHat): Stores a reference to the SenseHat object in use.
-        orientation_degrees (dict): Stores the current roll, pitch, and yaw of the sense HAT.
-        thread (Thread): Stores the thread that continually updates the orientation; started in constructor.
-        lock (Lock): Stores the lock that controls access to orientation_degrees.
+        orientation (SnapshotCell): Holds the latest roll, pitch, and yaw of the sense HAT, as a read-only dict.
+        threaded (bool): Whether the workers are used; if not, the sense HAT is read when asked.
+        sampler (Worker): Reads the orientation every ORIENTATION_SAMPLE_INTERVAL seconds; if it stops because of an
+            error, the orientation stops changing, so checkWorkers should be called regularly.
+        input_reader (Worker): Continually reads joystick events into the events list.
+        events (list): Joystick events read by input_reader that have not been collected yet.
+        events_lock (InstrumentedLock): Controls access to events.
     """
 
-    def __init__(self, sense_hat: SenseHat):
+    def __init__(self, sense_hat: SenseHat, threaded=True):
+        """
+        Args:
+            sense_hat: The SenseHat object to use, or stand-in hardware with the same methods.
+            threaded: If False, the workers are not started, and updateOrientation must be called instead.
+        """
         self.sense_hat = sense_hat
-        self.orientation_degrees = self.sense_hat.get_orientation_degrees()
+        self.orientation = SnapshotCell(MappingProxyType(self.sense_hat.get_orientation_degrees()))
+        self.threaded = threaded
+
+        self.events = []
+        self.events_lock = InstrumentedLock()
+
+        self.sampler = Worker("orientation sampler", self.sampleOrientation)
+        self.input_reader = Worker("joystick reader", self.readJoystick)
+
+        if threaded:
+            self.start()
+
+    @property
+    def orientation_degrees(self):
+        """ The latest roll, pitch, and yaw of the sense HAT, as a read-only dict. """
+        return self.orientation.read().value
+
+    def updateOrientation(self):
+        """ Reads the orientation from the sense HAT once, and publishes it. """
+        self.orientation.publish(MappingProxyType(self.sense_hat.get_orientation_degrees()))
+
+    def sampleOrientation(self):
+        """ Reads the orientation, then waits a short time, so the sampler does not compete with the game loop. """
+        self.updateOrientation()
+        self.sampler.stopping.wait(ORIENTATION_SAMPLE_INTERVAL)
+
+    def readJoystick(self):
+        """ Reads new joystick events into the events list, waiting a short time if there are none. """
+        new_events = self.sense_hat.stick.get_events()
+        if new_events:
+            with self.events_lock:
+                self.events += new_events
+        else:
+            self.input_reader.stopping.wait(JOYSTICK_POLL_INTERVAL)
+
+    def checkWorkers(self):
+        """ Raises a RuntimeError if either worker has stopped because of an error. """
+        for worker in (self.sampler, self.input_reader):
+            if worker.error is not None:
+                raise RuntimeError(f"Sense HAT {worker.name} stopped.") from worker.error
+
+    def getNewEvents(self) -> list:
+        """ Returns the joystick events since the last call; also checks the workers are still reading, as this is
+        called every frame.
+        """
+        if not self.threaded:
+            return self.sense_hat.stick.get_events()
 
-        self.thread = Thread(target=self.repeatedlyUpdateOrientation)
-        self.lock = Lock()
+        self.checkWorkers()
 
-        self.thread.start()
+        with self.events_lock:
+            new_events, self.events = self.events, []
+        return new_events
 
-    def repeatedlyUpdateOrientation(self):
-        """ Updates the orientation attribute, until the sense_hat attribute is None. To be passed to thread. """
-        # Only continue to loop if the SenseHat object is set.
-        while self.sense_hat is not None:
-            # Lock the orientation_degrees attribute, update it, and unlock it.
-            with self.lock:
-                self.orientation_degrees = self.sense_hat.get_orientation_degrees()
+    def start(self):
+        """ Starts the workers. """
+        self.sampler.start()
+        self.input_reader.start()
+
+    def stop(self, timeout=None) -> bool:
+        """ Stops the workers, and waits for them to finish.
+
+        Returns:
+            bool: Whether both workers stopped within the timeout.
+        """
+        self.sampler.stop()
+        self.input_reader.stop()
+        # Join both, even if the first does not stop in time
+        sampler_stopped = self.sampler.join(timeout)
+        input_reader_stopped = self.input_reader.join(timeout)
+        return sampler_stopped and input_reader_stopped
+
+    def reset(self, sense_hat: SenseHat):
+        """ Switches to a new SenseHat object, making sure no worker is using the old one while switching. The
+        workers are restarted afterwards, clearing any error that stopped them.
+        """
+        if self.threaded and not self.stop(WORKER_STOP_TIMEOUT):
+            raise RuntimeError("Sense HAT workers did not stop in time to reset.")
+
+        self.sense_hat = sense_hat
+        if self.threaded:
+            # Both have stopped, so this only counts the restart and starts them again
+            self.sampler.restart(WORKER_STOP_TIMEOUT)
+            self.input_reader.restart(WORKER_STOP_TIMEOUT)
 
 
 # TODO: test; implement dimension indicator on matrix
@@ -59,14 +151,31 @@ class GameManager:
         current_dim (int): The current dimension the player is searching in.
         dim_colors (tuple): Stores the colors that represent each dimension, as a tuple of RGB constants; used to
             display the current dimension on the sense HAT matrix.
-        matrix_buffer (list): Stores a list of 64 lists of three values representing red, green, and blue respectively.
-            This is used to build up an image to be displayed on the LED matrix of the sense HAT.
+        geometry (DisplayGeometry): The size of the display, and the layout of everything shown on it.
+        frame_buffer (FrameBuffer): Used to build up an image to be displayed on the LED matrix of the sense HAT, or
+            other displays.
+        displays (list): The displays each frame is shown on.
+        frame_capture (FrameCapture): If set, records every frame rendered, for debugging; None by default.
     """
 
-    def __init__(self):
+    def __init__(self, sense_hat=None, threaded=True, geometry=None, displays=None, display=DISPLAY):
+        """
+        Args:
+            sense_hat: The SenseHat object to use, or stand-in hardware with the same methods; if None, a new SenseHat
+                object is created.
+            threaded: Whether the orientation should be read continually by a thread; see SenseHatRef.
+            geometry: The size of the display; if None, the size set in constants is used.
+            displays: The displays to show frames on; if None, a single display of the kind given by display is used.
+            display: The kind of display to use if displays is None; see makeDisplay.
+        """
         # Initialise sense HAT
-        self.sense_ref = SenseHatRef(SenseHat())
-        self.sense_ref.sense_hat.set_imu_config(False, True, False)
+        if sense_hat is None:
+            if SenseHat is None:
+                raise RuntimeError("The sense_hat library is not installed; pass stand-in hardware instead.")
+            sense_hat = SenseHat()
+        # Configure before the workers start reading
+        sense_hat.set_imu_config(False, True, False)
+        self.sense_ref = SenseHatRef(sense_hat, threaded)
 
         # Set initial game state to be in the main menu
         self.game_state = GameState.MENU
@@ -77,9 +186,11 @@ class GameManager:
 
         self.ghosts = []
 
-        # Initialise matrix buffer
-        self.matrix_buffer = []
-        self.clearMatrixBuffer()
+        # Initialise display
+        self.geometry = geometry if geometry is not None else DisplayGeometry()
+        self.frame_buffer = FrameBuffer(self.geometry, ("proximity_bar", "charge_bar", "focus", "ghosts"))
+        self.displays = displays if displays is not None else [makeDisplay(display, self.geometry, self.sense_ref)]
+        self.frame_capture = None
 
         # Subsystems
         self.shutdown_checker = ShutdownChecker(StickDir.UP, debug=True)
@@ -88,13 +199,14 @@ class GameManager:
 
     # TODO: test
     def resetSenseHAT(self):
-        """ Resets the sense HAT by reassigning sense_ref to a new SenseHat object. """
-        self.sense_ref.sense_hat = SenseHat()
-        self.sense_ref.sense_hat.set_imu_config(False, True, False)
+        """ Resets the sense HAT by switching sense_ref to a new SenseHat object. """
+        sense_hat = SenseHat()
+        sense_hat.set_imu_config(False, True, False)
+        self.sense_ref.reset(sense_hat)
 
     def getNewJoystickEvents(self):
-        """ Retrieves new events from joystick since last call (basically calls get_events). """
-        return self.sense_ref.sense_hat.stick.get_events()
+        """ Retrieves new events from joystick since last call. """
+        return self.sense_ref.getNewEvents()
 
     def interpretNewEvents(self, events: [InputEvent]):
         """ Handles new events from the senseHAT joystick. """
@@ -156,27 +268,59 @@ class GameManager:
         self.attack_system.attempting_attack = True
 
     # todo: test
-    def prepareToRender(self):
-        """ Calls the render functions of all subsystems to render to the matrix buffer. """
-        # Order matters; last called will overwrite previous renders.
-        self.clearMatrixBuffer()
+    def prepareToRender(self, ghosts=None):
+        """ Calls the render functions of all subsystems to render to the frame buffer.
+
+        Args:
+            ghosts (list): The ghosts that may be on the display, e.g. those in view of a GhostScheduler; defaults to
+                all ghosts.
+        """
+        # Each subsystem draws to its own layer of the frame buffer; the order of layers is set in the constructor.
         self.proximity_bar.renderToBuffer()
         self.attack_system.renderChargeBarToBuffer()
         self.attack_system.renderFocusEffectToBuffer()
-        # TODO: optimise ghost rendering?
-        for ghost in self.ghosts:
-            for pixel in ghost.calcImageData():
-                self.
+        self.renderGhostsToBuffer(ghosts)
+
+    def renderGhostsToBuffer(self, ghosts=None):
+        """ Writes the ghosts on the display to the frame buffer.
 
-            # todo: left off here; render ghost pixels
+        Args:
+            ghosts (list): The ghosts that may be on the display; defaults to all ghosts.
+        """
+        width = self.geometry.width
+        height = self.geometry.height
+
+        # Find the ghosts that can be seen, and describe them so the layer is only redrawn when they change
+        visible = []
+        for ghost in self.ghosts if ghosts is None else ghosts:
+            pxl_pos = ghost.relative_sense.pxl_pos
+            appearance = ghost.appearance
+            # Skip ghosts too far off the display for any of their pixels to show
+            if pxl_pos and -len(appearance[0]) < pxl_pos[0] < width + len(appearance[0]) and \
+                    -len(appearance) < pxl_pos[1] < height + len(appearance):
+                visible.append((pxl_pos[0], pxl_pos[1], appearance, ghost.centre))
+
+        key = tuple((x, y, id(appearance)) for x, y, appearance, _ in visible)
+        if self.frame_buffer.hasKey("ghosts", key):
+            return
+        if not visible:
+            self.frame_buffer.clearLayer("ghosts")
+            return
 
-    def clearMatrixBuffer(self):
-        """ Resets the matrix buffer to hold 64 lists of three zeros. """
-        self.matrix_buffer = [[0, 0, 0] * 64]
+        sprite_pixels = [self.frame_buffer.calcSpritePixels((x, y), appearance, centre)
+                         for x, y, appearance, centre in visible]
+        indices = np.concatenate([pixels[0] for pixels in sprite_pixels])
+        colors = np.concatenate([pixels[1] for pixels in sprite_pixels])
+        self.frame_buffer.setLayer("ghosts", indices, colors, key)
 
     def render(self):
-        """ Renders the contents of the matrix buffer. """
-        self.sense_ref.sense_hat.set_pixels(self.matrix_buffer)
+        """ Shows the contents of the frame buffer on each display. """
+        changed = self.frame_buffer.present()
+        for display in self.displays:
+            display.show(self.frame_buffer, changed)
+
+        if self.frame_capture is not None:
+            self.frame_capture.capture(self.frame_buffer.shown)
 
 
 class GhostRelativeSenseHAT:
@@ -190,6 +334,8 @@ class GhostRelativeSenseHAT:
         displacement, vertical displacement].
     """
 
+    __slots__ = ("ghost", "x_disp", "y_disp", "distance", "pxl_pos")
+
     def __init__(self, ghost):
         self.ghost = ghost
         self.x_disp = 0
@@ -199,7 +345,6 @@ class GhostRelativeSenseHAT:
 
     def updateDisplacements(self, sense_orientation: dict):
         """ Updates the displacements of the ghost relative to sense HAT. """
-        print(sense_orientation['yaw'], sense_orientation['roll'])
         self.x_disp = calcXAngularDisp(self.ghost.angle[0], sense_orientation['yaw'])
         self.y_disp = calcYAngularDisp(self.ghost.angle[1], sense_orientation['roll'])
 
@@ -207,61 +352,86 @@ class GhostRelativeSenseHAT:
         """ Updates the distance attribute, depending on the displacement attributes. """
         self.distance = calcDist(self.x_disp, self.y_disp)
 
-    def updatePxlPos(self):
-        """ Updates the pxl_pos attribute, depending on the displacement attributes. """
-        self.pxl_pos = calcPxlPos(self.x_disp, self.y_disp)
+    def updatePxlPos(self, geometry: DisplayGeometry):
+        """ Updates the pxl_pos attribute, depending on the displacement attributes and the size of the display. """
+        self.pxl_pos = geometry.calcPxlPos(self.x_disp, self.y_disp)
 
 
 class Ghost:
-    """ Stores data and behaviour for a ghost. A class for other types of ghost to inherit from.
+    """ Stores the data of a single ghost. Data shared by all ghosts of the same type (appearance, movement, health and
+    panic settings) is kept in the ghost type registry, so each ghost only stores what changes during play.
 
     Attributes:
+        type_id (int): The id of the ghost's type in GHOST_TYPES.
+        state (GhostState): Selects the sprite of the ghost type to show.
         angle (list): The horizontal and vertical angles from starting point at indexes 0 and 1 respectively.
-            Initially (0, 0)
-        current_dim (int): The dimension the ghost is currently at, initially 0.
-        max_health (float): The maximum and initial amount of health a ghost has.
+            Initially random.
+        current_dim (int): The dimension the ghost is currently at, initially random.
         health (float): The current amount of health a ghost has.
-        passive_move_delay (float): The time in seconds between each movement.
-        panicked_move_delay (float) The time in seconds between each movement when panicking.
         time_last_moved (float): The time (since epoch) the ghost last moved at, used to determine when to move the ghost.
-        appearance (list): A 2D array [y][x] that stores lists of 3 values (RGB) to represent the appearance of the ghost on
-            the LED matrix.
-        centre (list): The pixel within the appearance attribute that should be treated as the centre
         panic_progress (float): When this value equals the panic_threshold, the ghost panics.
-        panic_threshold (float): How long the ghost should be on the screen before using panic movement.
         time_last_panic_checked (float): Keeps track of the time (since epoch) that the panic last increased.
     """
 
-    def __init__(self):
+    __slots__ = ("type_id", "state", "angle", "current_dim", "health", "time_last_moved", "panic_progress",
+                 "time_last_panic_checked", "relative_sense")
+
+    def __init__(self, type_id=BASIC, current_dim=None):
+        """
+        Args:
+            type_id: The id of the ghost's type, as returned by registerGhostType.
+            current_dim: The dimension to put the ghost in; if None, it is random.
+        """
+        self.type_id = type_id
+        self.state = GhostState.IDLE
+
         # Generate random location and dimension
         self.angle = [randint(0, 360), randint(0, 180)]
-        self.current_dim = randint(1, NUM_DIMS)
+        self.current_dim = randint(1, NUM_DIMS) if current_dim is None else current_dim
 
         # Initialise health
-        max_health = 10
-        self.max_health = max_health
-        self.health = max_health
+        self.health = GHOST_TYPES[type_id].max_health
 
         # Initialise move delay
-        self.passive_move_delay = 1
-        self.panicked_move_delay = 0.1
         self.time_last_moved = time()
 
-        # Initialise appearance
-        self.appearance = [[[255, 255, 255]]]
-        self.centre = [0, 0]
-
         # Initialise panic
         self.panic_progress = 0
-        self.panic_threshold = 1
         self.time_last_panic_checked = time()
 
         # Initialise reference to Sense HAT, and its related data
         self.relative_sense = GhostRelativeSenseHAT(self)
 
-        # Warn usage of base class
-        if type(self) == Ghost:
-            warnNYI("Using the base class for Ghost types.")
+    # Data shared by all ghosts of the same type
+    @property
+    def ghost_type(self):
+        return GHOST_TYPES[self.type_id]
+
+    @property
+    def max_health(self) -> float:
+        return GHOST_TYPES[self.type_id].max_health
+
+    @property
+    def passive_move_delay(self) -> float:
+        return GHOST_TYPES[self.type_id].passive_move_delay
+
+    @property
+    def panicked_move_delay(self) -> float:
+        return GHOST_TYPES[self.type_id].panicked_move_delay
+
+    @property
+    def panic_threshold(self) -> float:
+        return GHOST_TYPES[self.type_id].panic_threshold
+
+    @property
+    def appearance(self) -> tuple:
+        """ A 2D tuple [y][x] of (R, G, B) tuples to represent the ghost on the LED matrix, depending on its state. """
+        return GHOST_TYPES[self.type_id].sprites[self.state]
+
+    @property
+    def centre(self) -> tuple:
+        """ The pixel within the appearance that should be treated as the centre. """
+        return GHOST_TYPES[self.type_id].centre
 
     def getTimeSinceMoved(self) -> float:
         """
@@ -292,8 +462,8 @@ class Ghost:
         Returns:
             bool: Whether the change to vertical angle was in range and applied.
         """
-        # Apply horizontal movement
-        self.angle[0] += x
+        # Apply horizontal movement, wrapping around to stay within 0 and 360
+        self.angle[0] = (self.angle[0] + x) % 360
 
         # Check if vertical movement can be applied, apply it is so
         in_range_after_moved = 0 <= self.angle[1] + y <= 180
@@ -304,26 +474,27 @@ class Ghost:
 
     def movePassively(self):
         """ Performs a single movement when not panicking (i.e., off screen). """
-        self.changeAngle(randint(-2, 2), randint(-2, 2))
-        self.appearance[0][0] = [0, 255, 0]
-        warnNYI("movePassively")
+        step = GHOST_TYPES[self.type_id].passive_step
+        self.changeAngle(randint(-step, step), randint(-step, step))
+        self.state = GhostState.PASSIVE
 
     def movePanicked(self):
         """ Performs a single movement when panicking (i.e., on screen or attacked). """
-        self.changeAngle(randint(-5, 5), randint(-5, 5))
-        self.appearance[0][0] = [255, 0, 0]
-        warnNYI("movePanicked")
+        step = GHOST_TYPES[self.type_id].panicked_step
+        self.changeAngle(randint(-step, step), randint(-step, step))
+        self.state = GhostState.PANICKED
 
-    def updatePanic(self, pxl_pos: list):
+    def updatePanic(self, pxl_pos: list, geometry: DisplayGeometry):
         """ Updates the panic_progress attribute, depending on whether the ghost is visible on the matrix or not.
 
         Args:
             pxl_pos: List containing [horizontal pixel position, vertical pixel position].
+            geometry: The size of the display.
         """
         time_since_panic_checked = time() - self.time_last_panic_checked
 
         # If the ghost is on the matrix, increment the panic_progress attribute by time on matrix
-        if 0 <= pxl_pos[0] <= 7 and 0 <= pxl_pos[1] <= 7:
+        if geometry.isOnDisplay(pxl_pos):
             # Increase panic progress ad infinitum by the time it is on screen;
             # panic increases the longer the ghost is onscreen
             self.panic_progress += time_since_panic_checked
@@ -339,12 +510,15 @@ class Ghost:
 
     def updateMovement(self):
         """ Perform movement; check panic progress to determine which function to run, then check if time to move. """
+        ghost_type = GHOST_TYPES[self.type_id]
         # Passive movement
-        if self.panic_progress < self.panic_threshold and self.getTimeSinceMoved() > self.passive_move_delay:
+        if self.panic_progress < ghost_type.panic_threshold and \
+                self.getTimeSinceMoved() > ghost_type.passive_move_delay:
             self.movePassively()
             self.time_last_moved = time()
         # Panicked movement
-        elif self.panic_progress >= self.panic_threshold and self.getTimeSinceMoved() > self.panicked_move_delay:
+        elif self.panic_progress >= ghost_type.panic_threshold and \
+                self.getTimeSinceMoved() > ghost_type.panicked_move_delay:
             self.movePanicked()
             self.time_last_moved = time()
 
@@ -353,21 +527,31 @@ class Ghost:
         self.relative_sense.updateDisplacements(sense_orientation)
         self.relative_sense.updateDistance()
 
-    def updateGhost(self, sense_orientation: dict):
-        """ Updates ghost's panic/passive state, position, and data regarding position from sense HAT. """
+    def updateGhost(self, sense_orientation: dict, geometry: DisplayGeometry, move=True):
+        """ Updates ghost's panic/passive state, position, and data regarding position from sense HAT.
+
+        Args:
+            sense_orientation: The current orientation of the sense HAT.
+            geometry: The size of the display.
+            move: If False, the ghost is not moved; used when ghosts are moved in bulk by a MovementEngine.
+        """
         # Update panic
-        self.relative_sense.updatePxlPos()
-        self.updatePanic(self.relative_sense.pxl_pos)
+        self.relative_sense.updatePxlPos(geometry)
+        self.updatePanic(self.relative_sense.pxl_pos, geometry)
 
         # Update movement
-        self.updateMovement()
+        if move:
+            self.updateMovement()
 
         # Update data relative to sense HAT
         self.updateRelativeSenseData(sense_orientation)
 
-    def calcImageData(self) -> list:
+    def calcImageData(self, geometry: DisplayGeometry) -> list:
         """ Renders the ghost's appearance on the sense HAT LED matrix, relative to the ghost's core
 
+        Args:
+            geometry: The size of the display.
+
         Returns:
             list: A list of tuples containing (x coordinate on matrix, y coordinate on matrix, pixel to display)
         """
@@ -378,22 +562,24 @@ class Ghost:
 
         pixels_to_show = []
 
+        centre = self.centre
+
         # For each row of pixels in appearance...
         for i, row in enumerate(self.appearance):
             # For each pixel in each row...
             for j, pxl in enumerate(row):
                 # Calculate position of pixel relative to core pixel
-                relative_x = core_pxl_x + (j - self.centre[0])
-                relative_y = core_pxl_y + (i - self.centre[1])
+                relative_x = core_pxl_x + (j - centre[0])
+                relative_y = core_pxl_y + (i - centre[1])
                 # Check that pixel fits on matrix
-                if 0 <= relative_x <= 7 and 0 <= relative_y <= 7:
+                if geometry.isOnDisplay((relative_x, relative_y)):
                     pixels_to_show.append((relative_x, relative_y, pxl))
 
         return pixels_to_show
 
     def __repr__(self):
-        return f"Ghost at {self.angle}, health: {self.health}/{self.max_health}, " \
-               f"panic progress: {self.panic_progress}/{self.panic_progress};"
+        return f"{self.ghost_type.name} ghost at {self.angle}, health: {self.health}/{self.max_health}, " \
+               f"panic progress: {self.panic_progress}/{self.panic_threshold};"
 
 
 # Used in ShutdownChecker
@@ -472,7 +658,8 @@ class ProximityBar:
         game_manager (GameManager): The GameManager object storing this ProximityBar instance.
         colors (list): A list containing 8 lists of the form [R, G, B], that specifies the range of colors to use.
         max_distance (float): The maximum distance that ghosts can be detected from.
-        bar_height (int): The height of the bar after the update method is called.
+        bar_height (int): The height of the bar after the update method is called, in steps of hud_scale pixels.
+        max_bar_height (int): The greatest height of the bar; 7 on the 8x8 sense HAT matrix.
     """
 
     def __init__(self, game_manager: GameManager, max_distance=150):
@@ -482,8 +669,16 @@ class ProximityBar:
         self.colors = [RGB.RED, RGB.ORANGE, RGB.ORANGE, RGB.YELLOW,
                        RGB.YELLOW, RGB.GREEN, RGB.GREEN, RGB.BLUE]
 
+        geometry = game_manager.geometry
+        self.max_bar_height = geometry.height // geometry.hud_scale - 1
+
     def update(self, ghosts: [Ghost]):
         """ Performs calculations needed to update the proximity bar. """
+        # With no ghosts to detect, show nothing on the bar
+        if not ghosts:
+            self.bar_height = -1
+            return self.bar_height
+
         # Determine which ghost data has the lowest data
         nearest_ghost = ghosts[0]  # Use first ghost as placeholder
         for ghost in ghosts:
@@ -513,43 +708,55 @@ class ProximityBar:
         y = 7(x - D)/(L√2 - D)
         Where y = proximity bar height from 0 to 7 inclusive, 
         x = distance from 150 to √2 of L (where L = LIMIT) inclusive, respectively.
+        On other displays, 7 is replaced by max_bar_height.
         """
-        bar_height = round((7 * (nearest_ghost.relative_sense.distance - self.max_distance)) / (
-                (2 ** 0.5) * RANGE - self.max_distance))
+        bar_height = round((self.max_bar_height * (nearest_ghost.relative_sense.distance - self.max_distance)) / (
+                (2 ** 0.5) * self.game_manager.geometry.view_range - self.max_distance))
         # Limit bar height
-        if bar_height > 7:
-            bar_height = 7
+        if bar_height > self.max_bar_height:
+            bar_height = self.max_bar_height
 
         self.bar_height = bar_height
         return self.bar_height
 
     def renderToBuffer(self):
-        """ Displays the proximity bar on the sense HAT. """
+        """ Displays the proximity bar down the left edge of the display. """
+        frame_buffer = self.game_manager.frame_buffer
         # If the ghost is not within range, show nothing on bar.
-        # This is done by starting from the top left pixel and stepping eight pixels with square bracket notation.
-        if self.bar_height < 0:
-            self.game_manager.matrix_buffer[::8] = [RGB.BLANK.value] * 8
+        if self.bar_height <= 0:
+            frame_buffer.clearLayer("proximity_bar")
+            return
+        # Only redraw the bar when its height changes
+        if frame_buffer.hasKey("proximity_bar", self.bar_height):
+            return
 
-        # Ghost is in range
-        else:
-            # Determine color to use
-            color = self.colors[7 - self.bar_height].value
-            # Show a number of blank pixels, and as many colored pixels as bar_height; the number of blank pixels will
-            # change depending on bar_height. Write the blank ones first, so that the bar goes upwards.
-            blank_pixels = [RGB.BLANK.value] * (7 - self.bar_height)
-            colored_pixels = [color] * self.bar_height
-            self.game_manager.matrix_buffer[::8] = blank_pixels + colored_pixels
+        # Determine color to use, spreading the colors over the heights the bar can take
+        color_index = round((self.max_bar_height - self.bar_height) * (len(self.colors) - 1) / self.max_bar_height)
+        color = self.colors[color_index].value
+        # Show as many colored pixels as bar_height, from the bottom, so that the bar goes upwards.
+        indices = self.game_manager.geometry.calcBarIndices(0, self.max_bar_height, self.bar_height)
+        frame_buffer.setLayer("proximity_bar", indices, color, self.bar_height)
 
 
-# TODO test; also implement attacking ghosts
+# TODO test
 class AttackSystem:
-    """
+    """ Handles attacking ghosts in the focus square at the centre of the sense HAT matrix, and the charge bar that
+    shows when the next attack is possible.
 
+    Attributes:
+        game_manager (GameManager): The GameManager object storing this AttackSystem instance.
+        attack_cooldown (int): The time in seconds that must pass between attacks.
+        attack_damage (float): How much damage an attack does to each ghost in focus.
+        time_last_attacked (float): The time (since epoch) of the last attack attempt.
+        attempting_attack (bool): Whether the player tried to attack this frame.
+        hud_state (HUDState): How the focus effect should be shown.
+        charge_colors (list): The colors of the charge bar for each height.
     """
 
     def __init__(self, game_manager: GameManager):
         self.game_manager = game_manager
         self.attack_cooldown = 3
+        self.attack_damage = 5
         self.time_last_attacked = time()
         self.attempting_attack = False
         self.hud_state = HUDState.OFF
@@ -562,6 +769,25 @@ class AttackSystem:
         self.time_last_attacked = time()
         return can_attack
 
+    def processAttack(self, ghosts: [Ghost]) -> list:
+        """ If attempting to attack and the cooldown is complete, damages each ghost inside the focus square.
+
+        Returns:
+            list: The ghosts that were hit.
+        """
+        if not (self.attempting_attack and self.attackCooldownComplete()):
+            return []
+
+        geometry = self.game_manager.geometry
+        hit_ghosts = []
+        for ghost in ghosts:
+            pxl_pos = ghost.relative_sense.pxl_pos
+            if pxl_pos and geometry.isInFocus(pxl_pos):
+                ghost.damage(self.attack_damage)
+                hit_ghosts.append(ghost)
+
+        return hit_ghosts
+
     def calcChargeBarHeight(self):
         # Get time since last attacked; round to make it integer, using floor, because if normal round is used,
         # the bar may be full when the cooldown isn't complete.
@@ -572,10 +798,15 @@ class AttackSystem:
         return charge_bar_height
 
     def renderFocusEffectToBuffer(self):
-        """ Writes the focus effect (an orange square) to the game manager's matrix buffer. """
+        """ Writes the focus effect (an orange square) to the game manager's frame buffer. """
 
-        # If the HUD should be off, just return without doing anything to the matrix buffer.
+        frame_buffer = self.game_manager.frame_buffer
+        # If the HUD should be off, show nothing.
         if self.hud_state == HUDState.OFF:
+            frame_buffer.clearLayer("focus")
+            return
+        # Only redraw the focus effect when the HUD state changes
+        if frame_buffer.hasKey("focus", self.hud_state):
             return
 
         bright_orange = [184, 73, 0]
@@ -587,29 +818,21 @@ class AttackSystem:
         else:  # HUD state must be HUDState.BRIGHT
             color = bright_orange
 
-        # Fill in square of colored pixels
-        focus_pxl_at_top_left_corner = 9
-        focus_pxl_after_bottom_right_corner = 55
-        num_pixels_covered_by_focus = 36
-        self.game_manager.matrix_buffer[focus_pxl_at_top_left_corner:
-                                        focus_pxl_after_bottom_right_corner] = [color] * num_pixels_covered_by_focus
-
-        # Fill in square of blank pixels
-        first_pxl_inside_focus = 18
-        pxl_after_last_pxl_inside_focus = 46
-        num_pixels_inside_focus = 16
-        self.game_manager.matrix_buffer[first_pxl_inside_focus:
-                                        pxl_after_last_pxl_inside_focus] = [RGB.BLANK.value] * num_pixels_inside_focus
+        # Fill in the border of the square; the inside is left transparent
+        frame_buffer.setLayer("focus", self.game_manager.geometry.focus_indices, color, self.hud_state)
 
     def renderChargeBarToBuffer(self):
-        """ Writes the charge bar to the game manager's matrix buffer. """
+        """ Writes the charge bar, down the right edge of the display, to the game manager's frame buffer. """
         charge_bar_height = self.calcChargeBarHeight()
         charge_bar_color = self.charge_colors[charge_bar_height].value
 
-        # Write charge bar to matrix buffer
-        charge_bar_top_pxl = 47
-        # Take every eighth pixel after the top of the charge bar; balance the number of blank and colored pixels.
-        # Write the blank ones first, so that the bar goes upwards.
-        blank_pixels = [RGB.BLANK.value] * (self.attack_cooldown - charge_bar_height)
-        colored_pixels = [charge_bar_color] * charge_bar_height
-        self.game_manager.matrix_buffer[charge_bar_top_pxl::8] = blank_pixels + colored_pixels
+        # Only redraw the bar when its height changes
+        frame_buffer = self.game_manager.frame_buffer
+        if frame_buffer.hasKey("charge_bar", charge_bar_height):
+            return
+
+        # Write as many colored pixels as the charge bar height from the bottom, so that the bar goes upwards; the
+        # rest of the bar is left transparent.
+        geometry = self.game_manager.geometry
+        indices = geometry.calcBarIndices(geometry.width - geometry.hud_scale, self.attack_cooldown, charge_bar_height)
+        frame_buffer.setLayer("charge_bar", indices, charge_bar_color, charge_bar_height)
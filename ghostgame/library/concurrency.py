@@ -0,0 +1,176 @@
+from collections import namedtuple
+from threading import Thread, Lock, Event
+from time import perf_counter
+
+# A value published to a SnapshotCell, with the number of values published before it
+Snapshot = namedtuple("Snapshot", ("version", "value"))
+
+
+class ContentionStats:
+    """ Counts how often a lock was taken, and how often and how long threads had to wait for it.
+
+    Attributes:
+        acquisitions (int): The number of times the lock was acquired.
+        contended (int): The number of acquisitions that had to wait for another thread.
+        total_wait (float): The total time in seconds spent waiting for the lock.
+        max_wait (float): The longest time in seconds spent waiting for the lock.
+    """
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def contentionRate(self) -> float:
+        """ Returns the fraction of acquisitions that had to wait. """
+        return self.contended / self.acquisitions if self.acquisitions else 0.0
+
+    def __repr__(self):
+        return f"{self.acquisitions} acquisitions, {self.contended} contended ({self.contentionRate():.1%}), " \
+               f"waited {self.total_wait * 1000:.1f} ms in total, at most {self.max_wait * 1000:.1f} ms"
+
+
+class InstrumentedLock:
+    """ A lock that records contention; can be used in a with statement like Lock.
+
+    Attributes:
+        lock (Lock): The underlying lock.
+        stats (ContentionStats): The contention recorded so far; only updated while holding the lock.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.stats = ContentionStats()
+
+    def acquire(self):
+        # Try without waiting first, so that uncontended acquisitions are not timed
+        if self.lock.acquire(blocking=False):
+            self.stats.acquisitions += 1
+            return
+
+        start = perf_counter()
+        self.lock.acquire()
+        wait = perf_counter() - start
+
+        stats = self.stats
+        stats.acquisitions += 1
+        stats.contended += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SnapshotCell:
+    """ Holds the latest value published by one thread for any number of others to read. Values are replaced, never
+    changed, so readers never need a lock: reading the snapshot attribute is a single reference read, and always gives
+    a value and version that belong together.
+
+    Attributes:
+        snapshot (Snapshot): The latest value and its version.
+        publish_lock (InstrumentedLock): Keeps versions in order if more than one thread publishes.
+    """
+
+    def __init__(self, value):
+        """
+        Args:
+            value: The initial value, published as version 0; must not be changed after being published.
+        """
+        self.snapshot = Snapshot(0, value)
+        self.publish_lock = InstrumentedLock()
+
+    def read(self) -> Snapshot:
+        """ Returns the latest snapshot, without locking. """
+        return self.snapshot
+
+    def publish(self, value) -> int:
+        """ Replaces the value; value must not be changed after being published.
+
+        Returns:
+            int: The version of the new value.
+        """
+        with self.publish_lock:
+            version = self.snapshot.version + 1
+            self.snapshot = Snapshot(version, value)
+        return version
+
+
+class Worker:
+    """ Repeatedly calls a function on a background thread, with an orderly lifecycle: it can be started, asked to
+    stop, joined, and restarted (e.g. after the device it reads from is reset). Each run uses a new thread, since
+    threads cannot be started twice.
+
+    Attributes:
+        name (str): Names the thread, to help debugging.
+        step (callable): The function called on each iteration; should return promptly so that stops are noticed.
+        stopping (Event): Set when the worker should stop after its current iteration.
+        thread (Thread): The thread of the current run, or None if never started.
+        iterations (int): The number of times step has been called, over all runs.
+        restarts (int): The number of times the worker has been restarted.
+        error (Exception): The exception that stopped the worker, if any.
+    """
+
+    def __init__(self, name: str, step):
+        self.name = name
+        self.step = step
+        self.stopping = Event()
+        self.thread = None
+
+        self.iterations = 0
+        self.restarts = 0
+        self.error = None
+
+    def isRunning(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        """ Calls step until asked to stop. To be passed to thread. """
+        try:
+            while not self.stopping.is_set():
+                self.step()
+                self.iterations += 1
+        except Exception as e:
+            # Keep the error for whoever manages the worker, rather than losing it with the thread
+            self.error = e
+            raise
+
+    def start(self):
+        """ Starts a new run of the worker, if it is not already running. """
+        if self.isRunning():
+            return
+
+        self.stopping.clear()
+        self.error = None
+        self.thread = Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """ Asks the worker to stop after its current iteration, without waiting. """
+        self.stopping.set()
+
+    def join(self, timeout=None) -> bool:
+        """ Waits for the worker to stop.
+
+        Returns:
+            bool: Whether the worker has stopped.
+        """
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return not self.isRunning()
+
+    def restart(self, timeout=None):
+        """ Stops the worker, waits for it, and starts it again. """
+        self.stop()
+        if not self.join(timeout):
+            raise RuntimeError(f"Worker {self.name} did not stop within {timeout} seconds.")
+        self.restarts += 1
+        self.start()
@@ -1,4 +1,4 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 
 class RGB(Enum):
@@ -41,7 +41,59 @@ class HUDState(Enum):
     BRIGHT = "bright"
 
 
+# Indexes the sprites of a ghost type
+class GhostState(IntEnum):
+    IDLE = 0
+    PASSIVE = 1
+    PANICKED = 2
+
+
+# The kinds of timed event a ghost can have queued; see scheduler.py
+class GhostEvent(IntEnum):
+    MOVE = 0
+    CALM = 1  # Panic falls below the panic threshold while off the display
+
+
+# The kinds of asset an asset pack can hold; see assets.py
+class AssetKind(IntEnum):
+    PALETTE = 0
+    SPRITE = 1
+    GHOST_TYPE = 2
+    SPAWN_TABLE = 3
+
+
 # The number of explorable dimensions to have in the game
 NUM_DIMS = 3
 
+# The size of the LED display in pixels; the sense HAT matrix is 8x8, larger sizes need other displays (see display.py)
+DISPLAY_WIDTH = 8
+DISPLAY_HEIGHT = 8
+
+# Where frames are shown: "sensehat" for the sense HAT matrix, which must be 8x8, "tiled" for a grid of LED panels
+# (see TILED_PANEL_CLASS), or "preview" to save each frame to PREVIEW_PATH, for trying out other sizes on a desktop
+DISPLAY = "sensehat"
+PREVIEW_PATH = "preview.png"
+
+# The class of each panel of the tiled display, as "module.Class"; it is created with the (column, row) of the panel
+# in the grid, and must have a set_pixel(x, y, r, g, b) method like the sense HAT's. Panels are 8x8 pixels.
+TILED_PANEL_CLASS = None
+
 RANGE = 20  # The max range (in degrees) that ghosts can be observed on the LED matrix relative facing it directly
+
+# How long (in seconds) the orientation sampler waits between readings, how long the joystick reader waits between
+# checks when there are no events, and the longest time to wait for background workers to stop
+ORIENTATION_SAMPLE_INTERVAL = 0.005
+JOYSTICK_POLL_INTERVAL = 0.01
+WORKER_STOP_TIMEOUT = 2
+
+# Where the game state is saved to, and how often (in seconds) it is saved during play
+SNAPSHOT_PATH = "snapshot.ghst"
+SNAPSHOT_INTERVAL = 5
+
+# The asset pack made by asset_compiler.py to load ghost types and spawn tables from, if it exists, and the most
+# memory (in bytes of packed data) to keep decoded assets cached in
+ASSET_PACK_PATH = "world.gpak"
+ASSET_CACHE_SIZE = 1 << 20
+
+# Set to a path to record every frame shown on the LED matrix, for debugging; see capture_tool.py
+CAPTURE_PATH = None
@@ -0,0 +1,304 @@
+import importlib
+import os
+
+import numpy as np
+
+from .capture import encodePng, upscale
+from .constants import DISPLAY_WIDTH, DISPLAY_HEIGHT, RANGE, PREVIEW_PATH, TILED_PANEL_CLASS
+from .sensehat import calcPxlPos, checkPxlDistsFromEdge
+
+
+class DisplayGeometry:
+    """ Derives the projection of ghosts onto the display, and the layout of the HUD, from the size of the display.
+    Pixels are indexed row by row from the top left, as in the sense HAT's set_pixels.
+
+    Attributes:
+        width (int): The width of the display in pixels.
+        height (int): The height of the display in pixels.
+        num_pixels (int): The number of pixels on the display.
+        view_range (float): The displacement (in degrees) at which a ghost reaches the edge of the display.
+        hud_scale (int): The thickness in pixels of HUD elements; 1 on the 8x8 sense HAT matrix, and grows with the
+            display so that the HUD keeps its proportions.
+        focus_inner (tuple): The (left, top, right, bottom) bounds of the inside of the focus square; right and bottom
+            are exclusive.
+        focus_indices (np.ndarray): The pixels making up the border of the focus square.
+    """
+
+    def __init__(self, width=DISPLAY_WIDTH, height=DISPLAY_HEIGHT, view_range=RANGE):
+        self.width = width
+        self.height = height
+        self.num_pixels = width * height
+        self.view_range = view_range
+        self.hud_scale = max(1, min(width, height) // 8)
+
+        # The inside of the focus square covers the middle half of each axis (pixels 2 to 5 on the 8x8 matrix), and
+        # is surrounded by a border hud_scale pixels thick.
+        self.focus_inner = (width // 4, height // 4, width - width // 4, height - height // 4)
+        left, top, right, bottom = self.focus_inner
+        s = self.hud_scale
+        outer = self.rectIndices(left - s, top - s, right + s, bottom + s)
+        self.focus_indices = np.setdiff1d(outer, self.rectIndices(left, top, right, bottom))
+
+    def rectIndices(self, left: int, top: int, right: int, bottom: int) -> np.ndarray:
+        """ Returns the indexes of the pixels in a rectangle, clipped to the display; right and bottom are exclusive.
+        """
+        left, right = max(0, left), min(self.width, right)
+        top, bottom = max(0, top), min(self.height, bottom)
+        if left >= right or top >= bottom:
+            return np.empty(0, dtype=np.intp)
+
+        rows = np.arange(top, bottom)[:, np.newaxis]
+        columns = np.arange(left, right)[np.newaxis, :]
+        return (rows * self.width + columns).ravel()
+
+    def calcPxlPos(self, x_disp: float, y_disp: float) -> list:
+        """ Determines where on the display a ghost with some displacement appears; see sensehat.calcPxlPos. """
+        return calcPxlPos(x_disp, y_disp, self.width, self.height, self.view_range)
+
+    def checkPxlDistsFromEdge(self, pxl_pos: list) -> list:
+        """ Calculates the distance of some pixel from the edge of the display; see sensehat.checkPxlDistsFromEdge. """
+        return checkPxlDistsFromEdge(pxl_pos, self.width, self.height)
+
+    def isOnDisplay(self, pxl_pos: list) -> bool:
+        """ Checks if a pixel position, in the form [x, y], is on the display. """
+        return 0 <= pxl_pos[0] < self.width and 0 <= pxl_pos[1] < self.height
+
+    def isInFocus(self, pxl_pos: list) -> bool:
+        """ Checks if a pixel position, in the form [x, y], is inside the focus square. """
+        left, top, right, bottom = self.focus_inner
+        return left <= pxl_pos[0] < right and top <= pxl_pos[1] < bottom
+
+    def calcBarIndices(self, left: int, length: int, filled: int) -> np.ndarray:
+        """ Returns the pixels of a vertical bar drawn upwards from the bottom of the display.
+
+        Args:
+            left: The leftmost column of the bar; the bar is hud_scale pixels wide.
+            length: The number of steps in the full bar.
+            filled: The number of steps to fill; each step is hud_scale pixels tall, limited to the display height.
+        """
+        top = self.height - min(length, filled) * self.hud_scale
+        return self.rectIndices(left, top, left + self.hud_scale, self.height)
+
+
+class FrameBuffer:
+    """ Builds up each frame to show on the display from layers, such as the HUD and the ghosts. A layer is only
+    redrawn when its content changes, and only the pixels it covered or now covers are recomposited, so that the cost
+    of a frame depends on how much changed rather than the size of the display.
+
+    Attributes:
+        geometry (DisplayGeometry): The size and layout of the display.
+        layer_names (tuple): The names of the layers, from bottom to top; later layers are drawn over earlier ones.
+        coverage (np.ndarray): Whether each layer covers each pixel, of shape (number of layers, number of pixels).
+        colors (np.ndarray): The color of each layer at each pixel, of shape (number of layers, number of pixels, 3).
+        layer_indices (list): The pixels each layer currently covers.
+        layer_keys (list): Describes the content each layer was last drawn with, so that redraws can be skipped.
+        dirty (list): The arrays of pixel indexes to recomposite on the next present.
+        shown (np.ndarray): The frame last presented, of shape (number of pixels, 3).
+        sprite_cache (dict): Maps the id and centre of a sprite to its pixel offsets and colors as arrays.
+    """
+
+    def __init__(self, geometry: DisplayGeometry, layer_names: tuple):
+        self.geometry = geometry
+        self.layer_names = layer_names
+
+        num_layers = len(layer_names)
+        self.coverage = np.zeros((num_layers, geometry.num_pixels), dtype=bool)
+        self.colors = np.zeros((num_layers, geometry.num_pixels, 3), dtype=np.uint8)
+        self.layer_indices = [np.empty(0, dtype=np.intp) for _ in layer_names]
+        self.layer_keys = [None for _ in layer_names]
+
+        self.dirty = []
+        self.shown = np.zeros((geometry.num_pixels, 3), dtype=np.uint8)
+        self.sprite_cache = {}
+
+    def hasKey(self, name: str, key) -> bool:
+        """ Checks if a layer was last drawn with some key, in which case it does not need to be redrawn. """
+        return self.layer_keys[self.layer_names.index(name)] == key
+
+    def setLayer(self, name: str, indices: np.ndarray, colors, key=None):
+        """ Replaces the content of a layer.
+
+        Args:
+            name: The name of the layer to draw.
+            indices: The indexes of the pixels the layer covers; the rest of the layer is transparent.
+            colors: A single (R, G, B) color for every pixel, or an array of colors of shape (len(indices), 3).
+            key: Describes everything the layer's content depends on, to be checked with hasKey before the next redraw.
+        """
+        layer = self.layer_names.index(name)
+        self.layer_keys[layer] = key
+
+        previous = self.layer_indices[layer]
+        self.coverage[layer, previous] = False
+        self.coverage[layer, indices] = True
+        self.colors[layer, indices] = colors
+        self.layer_indices[layer] = indices
+
+        self.dirty.append(previous)
+        self.dirty.append(indices)
+
+    def clearLayer(self, name: str):
+        """ Makes a layer fully transparent. """
+        if not self.hasKey(name, ()):
+            self.setLayer(name, np.empty(0, dtype=np.intp), (0, 0, 0), key=())
+
+    def calcSpritePixels(self, pxl_pos: list, sprite: tuple, centre: tuple) -> tuple:
+        """ Works out the pixels a sprite covers with its centre at some position, clipped to the display.
+
+        Args:
+            pxl_pos: Where the centre of the sprite should appear, in the form [x, y].
+            sprite: A 2D tuple [y][x] of (R, G, B) tuples.
+            centre: The pixel within the sprite to place at pxl_pos, in the form (x, y).
+
+        Returns:
+            tuple: (the indexes of the pixels covered, the color of each pixel covered).
+        """
+        # Sprites are immutable and live in the ghost type registry for the life of the game, so their ids are stable
+        key = (id(sprite), centre)
+        cached = self.sprite_cache.get(key)
+        if cached is None:
+            colors = np.array(sprite, dtype=np.uint8).reshape(-1, 3)
+            rows, columns = np.divmod(np.arange(len(colors)), len(sprite[0]))
+            cached = (columns - centre[0], rows - centre[1], colors)
+            self.sprite_cache[key] = cached
+
+        x_offsets, y_offsets, colors = cached
+        xs = x_offsets + pxl_pos[0]
+        ys = y_offsets + pxl_pos[1]
+        on_display = (xs >= 0) & (xs < self.geometry.width) & (ys >= 0) & (ys < self.geometry.height)
+        return ys[on_display] * self.geometry.width + xs[on_display], colors[on_display]
+
+    def present(self) -> np.ndarray:
+        """ Composites the layers wherever they changed, making the result the shown frame.
+
+        Returns:
+            np.ndarray: The indexes of the pixels that changed since the last frame was presented.
+        """
+        if not self.dirty:
+            return np.empty(0, dtype=np.intp)
+
+        candidates = np.unique(np.concatenate(self.dirty))
+        self.dirty = []
+
+        # Paint the layers from bottom to top over a blank background, only at the candidate pixels
+        composite = np.zeros((len(candidates), 3), dtype=np.uint8)
+        for layer in range(len(self.layer_names)):
+            covered = self.coverage[layer, candidates]
+            composite[covered] = self.colors[layer, candidates[covered]]
+
+        changed_mask = (composite != self.shown[candidates]).any(axis=1)
+        changed = candidates[changed_mask]
+        self.shown[changed] = composite[changed_mask]
+        return changed
+
+
+class SenseHatDisplay:
+    """ Shows frames on the sense HAT's 8x8 LED matrix.
+
+    Attributes:
+        sense_ref (SenseHatRef): The reference to the sense HAT in use.
+        drawn_to (SenseHat): The SenseHat object last drawn to; when the sense HAT is reset, the new one starts blank,
+            so the whole frame is drawn to it even if nothing changed.
+    """
+
+    def __init__(self, sense_ref, geometry: DisplayGeometry):
+        """
+        Args:
+            sense_ref (SenseHatRef): The reference to the sense HAT in use.
+            geometry: The size of the frames that will be shown; must be 8x8.
+        """
+        if (geometry.width, geometry.height) != (8, 8):
+            raise ValueError(f"The sense HAT matrix is 8x8, so cannot show {geometry.width}x{geometry.height} frames; "
+                             f"use another display.")
+        self.sense_ref = sense_ref
+        self.drawn_to = None
+
+    def show(self, frame_buffer: FrameBuffer, changed: np.ndarray):
+        # The sense HAT can only be given the whole matrix, so only update it when something changed
+        sense_hat = self.sense_ref.sense_hat
+        if len(changed) or sense_hat is not self.drawn_to:
+            sense_hat.set_pixels(frame_buffer.shown.tolist())
+            self.drawn_to = sense_hat
+
+
+class TiledDisplay:
+    """ Shows frames on a grid of LED panels, each with a set_pixel(x, y, r, g, b) method like the sense HAT's; only
+    the pixels that changed are sent.
+
+    Attributes:
+        panels (list): The panels as a list of rows, from the top left.
+        panel_width (int): The width of each panel in pixels.
+        panel_height (int): The height of each panel in pixels.
+    """
+
+    def __init__(self, panels: list, panel_width=8, panel_height=8):
+        if len({len(row) for row in panels}) != 1:
+            raise ValueError("Every row of a tiled display needs the same number of panels.")
+        self.panels = panels
+        self.panel_width = panel_width
+        self.panel_height = panel_height
+
+    def show(self, frame_buffer: FrameBuffer, changed: np.ndarray):
+        ys, xs = np.divmod(changed, frame_buffer.geometry.width)
+        panel_ys, local_ys = np.divmod(ys, self.panel_height)
+        panel_xs, local_xs = np.divmod(xs, self.panel_width)
+
+        for panel_y, panel_x, local_y, local_x, color in zip(panel_ys.tolist(), panel_xs.tolist(), local_ys.tolist(),
+                                                             local_xs.tolist(), frame_buffer.shown[changed].tolist()):
+            self.panels[panel_y][panel_x].set_pixel(local_x, local_y, *color)
+
+
+class PreviewDisplay:
+    """ Shows frames on the desktop by saving them to an image, which can be left open in an image viewer.
+
+    Attributes:
+        path (str): The PNG file to write each frame to.
+        scale (int): The size in pixels of each LED in the image.
+    """
+
+    def __init__(self, path: str, scale=16):
+        self.path = path
+        self.scale = scale
+
+    def show(self, frame_buffer: FrameBuffer, changed: np.ndarray):
+        if len(changed):
+            geometry = frame_buffer.geometry
+            image = upscale(frame_buffer.shown.reshape(geometry.height, geometry.width, 3), self.scale)
+
+            # Replace the file in one go, so the viewer never reads half an image
+            with open(self.path + ".tmp", "wb") as file:
+                file.write(encodePng(image))
+            os.replace(self.path + ".tmp", self.path)
+
+
+def makeDisplay(kind: str, geometry: DisplayGeometry, sense_ref):
+    """ Creates a display of one of the kinds that can be chosen with the DISPLAY constant.
+
+    Args:
+        kind: "sensehat", "tiled", or "preview".
+        geometry: The size of the frames that will be shown.
+        sense_ref (SenseHatRef): The reference to the sense HAT in use; only used by the sense HAT display.
+
+    Returns:
+        The display, with a show(frame_buffer, changed) method.
+    """
+    if kind == "sensehat":
+        return SenseHatDisplay(sense_ref, geometry)
+
+    if kind == "preview":
+        return PreviewDisplay(PREVIEW_PATH)
+
+    if kind == "tiled":
+        if TILED_PANEL_CLASS is None:
+            raise ValueError("Set TILED_PANEL_CLASS to the class of the panels to use the tiled display.")
+        panel_width = panel_height = 8
+        if geometry.width % panel_width or geometry.height % panel_height:
+            raise ValueError(f"{geometry.width}x{geometry.height} frames cannot be tiled with "
+                             f"{panel_width}x{panel_height} panels.")
+
+        module_name, class_name = TILED_PANEL_CLASS.rsplit(".", 1)
+        panel_class = getattr(importlib.import_module(module_name), class_name)
+        panels = [[panel_class(column, row) for column in range(geometry.width // panel_width)]
+                  for row in range(geometry.height // panel_height)]
+        return TiledDisplay(panels, panel_width, panel_height)
+
+    raise ValueError(f"Unknown display {kind}.")
@@ -0,0 +1,122 @@
+from typing import NamedTuple
+
+from .constants import GhostState
+
+
+class GhostType(NamedTuple):
+    """ The data shared by every ghost of one type. Ghosts only store the id of their type, so this must not be
+    changed once registered.
+
+    Attributes:
+        name (str): Identifies the type; used when saving ghosts.
+        sprites (tuple): The appearance of the ghost in each GhostState, each a 2D tuple [y][x] of (R, G, B) tuples.
+        centre (tuple): The pixel within each sprite that should be treated as the centre, as (x, y).
+        passive_step (int): The most the ghost moves on each axis per passive movement.
+        panicked_step (int): The most the ghost moves on each axis per panicked movement.
+        passive_move_delay (float): The time in seconds between each movement.
+        panicked_move_delay (float): The time in seconds between each movement when panicking.
+        max_health (float): The maximum and initial amount of health the ghost has.
+        panic_threshold (float): How long the ghost should be on the screen before using panic movement.
+    """
+    name: str
+    sprites: tuple
+    centre: tuple
+    passive_step: int
+    panicked_step: int
+    passive_move_delay: float
+    panicked_move_delay: float
+    max_health: float
+    panic_threshold: float
+
+
+# Every registered ghost type, indexed by type id
+GHOST_TYPES = []
+
+# Asset packs to look for ghost types in when they are not registered yet
+ASSET_PACKS = []
+
+
+def registerGhostType(ghost_type: GhostType) -> int:
+    """ Adds a ghost type to the registry.
+
+    Returns:
+        int: The id of the ghost type, to be stored by ghosts of this type.
+    """
+    if ghost_type.name in (registered.name for registered in GHOST_TYPES):
+        raise ValueError(f"Ghost type {ghost_type.name} is already registered.")
+    if len(ghost_type.sprites) != len(GhostState):
+        raise ValueError(f"Ghost type {ghost_type.name} needs a sprite for each GhostState.")
+
+    GHOST_TYPES.append(ghost_type)
+    return len(GHOST_TYPES) - 1
+
+
+def mountAssetPack(pack):
+    """ Makes the ghost types in an asset pack available by name; each is registered the first time it is used.
+
+    Args:
+        pack (AssetPack): The asset pack to look in.
+    """
+    ASSET_PACKS.append(pack)
+
+
+def getGhostTypeId(name: str) -> int:
+    """ Finds the id of a ghost type by name, registering it from a mounted asset pack if it is not registered yet. """
+    for type_id, ghost_type in enumerate(GHOST_TYPES):
+        if ghost_type.name == name:
+            return type_id
+
+    for pack in ASSET_PACKS:
+        if pack.hasGhostType(name):
+            return registerGhostType(pack.getGhostType(name))
+    raise ValueError(f"Unknown ghost type {name}.")
+
+
+# Built in ghost types; sprites are listed in GhostState order (idle, passive, panicked)
+BASIC = registerGhostType(GhostType(
+    name="basic",
+    sprites=(
+        (((255, 255, 255),),),
+        (((0, 255, 0),),),
+        (((255, 0, 0),),),
+    ),
+    centre=(0, 0),
+    passive_step=2,
+    panicked_step=5,
+    passive_move_delay=1,
+    panicked_move_delay=0.1,
+    max_health=10,
+    panic_threshold=1,
+))
+
+BANSHEE = registerGhostType(GhostType(
+    name="banshee",
+    sprites=(
+        (((123, 3, 252), (123, 3, 252)),),
+        (((252, 3, 232), (252, 3, 232)),),
+        (((255, 0, 0), (255, 0, 0)),),
+    ),
+    centre=(0, 0),
+    passive_step=4,
+    panicked_step=8,
+    passive_move_delay=0.5,
+    panicked_move_delay=0.05,
+    max_health=6,
+    panic_threshold=0.5,
+))
+
+POLTERGEIST = registerGhostType(GhostType(
+    name="poltergeist",
+    sprites=(
+        (((3, 252, 207),), ((3, 252, 207),)),
+        (((0, 255, 0),), ((3, 252, 207),)),
+        (((255, 0, 0),), ((252, 107, 3),)),
+    ),
+    centre=(0, 0),
+    passive_step=1,
+    panicked_step=3,
+    passive_move_delay=2,
+    panicked_move_delay=0.2,
+    max_health=20,
+    panic_threshold=2,
+))
@@ -0,0 +1,101 @@
+import numpy as np
+
+from .constants import GhostState
+from .ghosttypes import GHOST_TYPES
+
+
+class MovementEngine:
+    """ Moves every due ghost at once with array operations, in place of calling Ghost.updateMovement on each ghost.
+    The random steps of all due ghosts are drawn in a single call to a seeded generator, so runs can be repeated.
+
+    While attached, each ghost's angle is a view into the angles array, so the ghosts and the engine share positions;
+    ghosts should only be moved through the engine.
+
+    Attributes:
+        rng (np.random.Generator): The random number generator used for steps.
+        ghosts (list): The ghosts being moved.
+        angles (np.ndarray): The horizontal and vertical angle of each ghost, of shape (number of ghosts, 2).
+        type_ids (np.ndarray): The type id of each ghost.
+        time_last_moved (np.ndarray): The time (since epoch) each ghost last moved at.
+        steps (np.ndarray): The (passive, panicked) step of each ghost type, indexed by type id.
+        delays (np.ndarray): The (passive, panicked) move delay of each ghost type, indexed by type id.
+        panic_thresholds (np.ndarray): The panic threshold of each ghost type, indexed by type id.
+    """
+
+    def __init__(self, ghosts: list, seed=None):
+        """
+        Args:
+            ghosts: The ghosts to move.
+            seed: Seeds the random number generator; if None, fresh randomness is used.
+        """
+        self.rng = np.random.default_rng(seed)
+        self.attach(ghosts)
+
+    def attach(self, ghosts: list):
+        """ Starts moving a new list of ghosts, e.g. after ghosts are added or a snapshot is loaded. """
+        # Per type tables, so that type data can be looked up for every ghost at once; rebuilt here, as types can be
+        # registered from asset packs during play
+        self.steps = np.array([(ghost_type.passive_step, ghost_type.panicked_step) for ghost_type in GHOST_TYPES],
+                              dtype=np.int64)
+        self.delays = np.array([(ghost_type.passive_move_delay, ghost_type.panicked_move_delay)
+                                for ghost_type in GHOST_TYPES], dtype=np.float64)
+        self.panic_thresholds = np.array([ghost_type.panic_threshold for ghost_type in GHOST_TYPES], dtype=np.float64)
+
+        n = len(ghosts)
+        self.ghosts = ghosts
+        self.angles = np.array([ghost.angle for ghost in ghosts], dtype=np.float64).reshape(n, 2)
+        self.type_ids = np.array([ghost.type_id for ghost in ghosts], dtype=np.intp)
+        self.time_last_moved = np.array([ghost.time_last_moved for ghost in ghosts], dtype=np.float64)
+
+        # Share the angle storage with the ghosts
+        for ghost, angle in zip(ghosts, self.angles):
+            ghost.angle = angle
+
+    def step(self, now: float) -> np.ndarray:
+        """ Moves every ghost whose move delay has passed, using its panicked movement if it is panicking.
+
+        Args:
+            now: The current time (since epoch).
+
+        Returns:
+            np.ndarray: The indexes of the ghosts that moved.
+        """
+        ghosts = self.ghosts
+        panic_progress = np.fromiter((ghost.panic_progress for ghost in ghosts), dtype=np.float64, count=len(ghosts))
+        panicked = panic_progress >= self.panic_thresholds[self.type_ids]
+
+        # Find the ghosts that are due to move; column 0 holds passive values and column 1 panicked values
+        delays = self.delays[self.type_ids, panicked.astype(np.intp)]
+        due = np.flatnonzero(now - self.time_last_moved > delays)
+        if due.size:
+            self.move(due, panicked[due], now)
+        return due
+
+    def move(self, due: np.ndarray, due_panicked: np.ndarray, now: float):
+        """ Moves some ghosts once each, regardless of when they last moved.
+
+        Args:
+            due: The indexes of the ghosts to move, without repeats.
+            due_panicked: Whether each ghost to move is panicking, and so uses its panicked movement.
+            now: The current time (since epoch).
+        """
+        ghosts = self.ghosts
+
+        # Draw the steps of every due ghost in one call, from -step to step inclusive on each axis
+        steps = self.steps[self.type_ids[due], due_panicked.astype(np.intp)][:, np.newaxis]
+        deltas = self.rng.integers(-steps, steps, size=(due.size, 2), endpoint=True)
+
+        moved = self.angles[due] + deltas
+        # Wrap horizontally, and only apply vertical movement that stays in range, as in Ghost.changeAngle
+        moved[:, 0] %= 360
+        out_of_range = (moved[:, 1] < 0) | (moved[:, 1] > 180)
+        moved[out_of_range, 1] = self.angles[due[out_of_range], 1]
+
+        self.angles[due] = moved
+        self.time_last_moved[due] = now
+
+        # Only the ghosts that moved need their state updating
+        for i, is_panicked in zip(due.tolist(), due_panicked.tolist()):
+            ghost = ghosts[i]
+            ghost.state = GhostState.PANICKED if is_panicked else GhostState.PASSIVE
+            ghost.time_last_moved = now
@@ -0,0 +1,312 @@
+import heapq
+from math import floor, inf
+
+import numpy as np
+
+from .constants import GhostEvent
+from .display import DisplayGeometry
+from .ghosttypes import GHOST_TYPES
+from .movement import MovementEngine
+from .sensehat import calcYAngularDisp
+
+
+class GhostScheduler:
+    """ Keeps track of when each ghost next needs attention, so that each frame only deals with the ghosts that have
+    an event due or are in view, rather than checking the time and position of every ghost.
+
+    Moves, and the end of panic for ghosts off the display, are timed events in a priority queue. Panic only builds
+    while a ghost is on the display, so ghosts are also sorted into a grid of cells by angle, to find the ghosts in view
+    without checking the rest. Off the display, a ghost's panic_progress is only brought up to date when one of its
+    events fires or it comes back into view; until then it is the progress at time_last_panic_checked, and is falling.
+
+    Attributes:
+        engine (MovementEngine): Moves the ghosts, and holds their angles and the times they last moved.
+        geometry (DisplayGeometry): The size of the display, which decides how far away ghosts can be seen.
+        cell_size (int): The size in degrees of each cell of the grid on both axes; must divide 360.
+        num_columns (int): The number of cells around the horizontal axis.
+        num_rows (int): The number of cells along the vertical axis; the last row only holds ghosts at 180 degrees.
+        reach (tuple): The greatest (horizontal, vertical) displacement in degrees at which a ghost can be drawn,
+            allowing for the size of its sprite.
+        cells (list): The set of indexes of the ghosts in each cell, indexed by row * num_columns + column.
+        ghost_cells (list): The cell each ghost is in.
+        panicked (list): Whether each ghost is panicking.
+        generations (list): For each GhostEvent, the number of times each ghost's event has been scheduled; queued
+            events from an earlier generation have been replaced, and are skipped.
+        queue (list): A heap of (due time, GhostEvent, ghost index, generation) tuples.
+        in_view (set): The indexes of the ghosts within reach on the last step.
+        on_display (set): The indexes of the ghosts whose centre was on the display on the last step.
+        num_fired (int): The number of events fired on the last step.
+    """
+
+    def __init__(self, engine: MovementEngine, geometry: DisplayGeometry, now: float, cell_size=5):
+        """
+        Args:
+            engine: The movement engine the ghosts are attached to.
+            geometry: The size of the display.
+            now: The current time (since epoch).
+            cell_size: The size in degrees of each cell of the grid.
+        """
+        if 360 % cell_size:
+            raise ValueError(f"Cell size {cell_size} does not divide 360 degrees.")
+
+        self.engine = engine
+        self.geometry = geometry
+        self.cell_size = cell_size
+        self.num_columns = 360 // cell_size
+        self.num_rows = 180 // cell_size + 1
+
+        self.attach(now)
+
+    def attach(self, now: float):
+        """ Starts scheduling the ghosts attached to the engine, e.g. after the engine is attached to new ghosts.
+
+        Args:
+            now: The current time (since epoch).
+        """
+        geometry = self.geometry
+
+        """ Derivation of the reach on the horizontal axis (the vertical axis is the same with the height)
+        From calcPxlPos, a ghost is drawn at pixel x = (W/2)d/R + W/2 - 1, where d = displacement, R = view range
+
+        A ghost is drawn if any of its sprite shows, so while -S < x < W + S, where S = size of the largest sprite
+
+        The furthest right: (W/2)d/R + W/2 - 1 < W + S
+        d < R(W/2 + S + 1)/(W/2)
+
+        The furthest left is nearer, so this is the reach both ways.
+        """
+        # Found here rather than in the constructor, as types can be registered from asset packs during play
+        max_sprite = max(max(len(sprite), len(sprite[0])) for ghost_type in GHOST_TYPES
+                         for sprite in ghost_type.sprites)
+        self.reach = (geometry.view_range * (geometry.width / 2 + max_sprite + 1) / (geometry.width / 2),
+                      geometry.view_range * (geometry.height / 2 + max_sprite + 1) / (geometry.height / 2))
+
+        ghosts = self.engine.ghosts
+        n = len(ghosts)
+
+        self.cells = [set() for _ in range(self.num_columns * self.num_rows)]
+        self.ghost_cells = [self.calcCell(ghost.angle) for ghost in ghosts]
+        for i, cell in enumerate(self.ghost_cells):
+            self.cells[cell].add(i)
+
+        self.panicked = [False] * n
+        self.generations = [[0] * n for _ in GhostEvent]
+        self.queue = []
+        self.in_view = set()
+        self.on_display = set()
+        self.num_fired = 0
+
+        # Every ghost starts off the display, so any panic left is falling
+        for i, ghost in enumerate(ghosts):
+            self.settlePanic(i, False, now)
+            self.panicked[i] = ghost.panic_progress >= ghost.panic_threshold
+            if self.panicked[i]:
+                self.schedule(i, GhostEvent.CALM, now + ghost.panic_progress - ghost.panic_threshold)
+            self.scheduleMove(i)
+
+    def calcCell(self, angle) -> int:
+        """ Finds the cell of the grid holding some angle, in the form [horizontal angle, vertical angle]. """
+        column = floor(angle[0] / self.cell_size) % self.num_columns
+        row = min(max(floor(angle[1] / self.cell_size), 0), self.num_rows - 1)
+        return row * self.num_columns + column
+
+    def updateCell(self, i: int):
+        """ Moves a ghost to the cell holding its angle, if it has left its old one. """
+        cell = self.calcCell(self.engine.ghosts[i].angle)
+        if cell != self.ghost_cells[i]:
+            self.cells[self.ghost_cells[i]].discard(i)
+            self.cells[cell].add(i)
+            self.ghost_cells[i] = cell
+
+    def schedule(self, i: int, kind: GhostEvent, due: float):
+        """ Queues an event for a ghost, replacing any of the same kind already queued for it. """
+        generations = self.generations[kind]
+        generations[i] += 1
+        heapq.heappush(self.queue, (due, kind, i, generations[i]))
+
+    def cancel(self, i: int, kind: GhostEvent):
+        """ Cancels a queued event for a ghost, if there is one. """
+        self.generations[kind][i] += 1
+
+    def scheduleMove(self, i: int):
+        """ Queues a ghost's next move, for when its move delay has passed since it last moved. """
+        ghost_type = GHOST_TYPES[self.engine.ghosts[i].type_id]
+        delay = ghost_type.panicked_move_delay if self.panicked[i] else ghost_type.passive_move_delay
+        self.schedule(i, GhostEvent.MOVE, float(self.engine.time_last_moved[i]) + delay)
+
+    def setPanicked(self, i: int, panicked: bool):
+        """ Changes whether a ghost is panicking; its next move is rescheduled, as its move delay has changed. """
+        if self.panicked[i] != panicked:
+            self.panicked[i] = panicked
+            self.scheduleMove(i)
+
+    def settlePanic(self, i: int, rising: bool, now: float):
+        """ Brings a ghost's panic_progress up to date, as in Ghost.updatePanic.
+
+        Args:
+            i: The index of the ghost.
+            rising: Whether the ghost has been on the display since its panic was last checked.
+            now: The current time (since epoch).
+        """
+        ghost = self.engine.ghosts[i]
+        # A ghost checked after now (e.g. made on another clock) has had no time on or off the display
+        elapsed = max(0.0, now - ghost.time_last_panic_checked)
+        if rising:
+            ghost.panic_progress += elapsed
+        else:
+            ghost.panic_progress = max(0, ghost.panic_progress - elapsed)
+        ghost.time_last_panic_checked = now
+
+    def compactQueue(self):
+        """ Removes replaced events from the queue, once they outnumber the ghosts. """
+        if len(self.queue) > 2 * len(self.engine.ghosts) + 64:
+            generations = self.generations
+            self.queue = [event for event in self.queue if event[3] == generations[event[1]][event[2]]]
+            heapq.heapify(self.queue)
+
+    def fireEvents(self, now: float):
+        """ Fires every event due by now, moving the ghosts due to move in one go. """
+        queue = self.queue
+        generations = self.generations
+        num_fired = 0
+        moving = []
+
+        while queue and queue[0][0] <= now:
+            due, kind, i, generation = heapq.heappop(queue)
+            if generation != generations[kind][i]:
+                continue
+            num_fired += 1
+
+            if kind == GhostEvent.MOVE:
+                moving.append(i)
+            else:
+                # The ghost has been off the display long enough for its panic to fall below the threshold
+                self.settlePanic(i, False, now)
+                self.setPanicked(i, False)
+
+        self.num_fired = num_fired
+        if not moving:
+            return
+
+        # A ghost that calmed down may have been queued to move twice
+        due = np.unique(moving)
+        self.engine.move(due, np.array([self.panicked[i] for i in due.tolist()], dtype=bool), now)
+        for i in due.tolist():
+            self.scheduleMove(i)
+            self.updateCell(i)
+
+    def findGhostsInView(self, sense_orientation: dict) -> set:
+        """ Finds the ghosts in every cell within reach of where the sense HAT is facing.
+
+        Returns:
+            set: The indexes of the ghosts found.
+        """
+        cell_size = self.cell_size
+        reach_x, reach_y = self.reach
+        yaw = sense_orientation["yaw"]
+        # The vertical angle the display is centred on, limited as in calcYAngularDisp
+        pitch = -calcYAngularDisp(0, sense_orientation["roll"])
+
+        # Columns wrap around, so may be repeated if the reach covers more than a full turn
+        columns = {column % self.num_columns for column in range(floor((yaw - reach_x) / cell_size),
+                                                                 floor((yaw + reach_x) / cell_size) + 1)}
+        first_row = max(0, floor((pitch - reach_y) / cell_size))
+        last_row = min(self.num_rows - 1, floor((pitch + reach_y) / cell_size))
+
+        found = set()
+        for row in range(first_row, last_row + 1):
+            for column in columns:
+                found.update(self.cells[row * self.num_columns + column])
+        return found
+
+    def step(self, now: float, sense_orientation: dict) -> list:
+        """ Fires the events due by now, then updates the data relative to the sense HAT and the panic of the ghosts in
+        view. Ghosts out of view are not looked at, and keep the relative data from when they were last in view.
+
+        Args:
+            now: The current time (since epoch).
+            sense_orientation: The current orientation of the sense HAT.
+
+        Returns:
+            list: The ghosts in view, in the order of the engine's ghosts; only these can be drawn or attacked.
+        """
+        self.fireEvents(now)
+
+        ghosts = self.engine.ghosts
+        geometry = self.geometry
+        in_view = self.findGhostsInView(sense_orientation)
+
+        # Ghosts that just left view are updated one last time, so their relative data places them off the display
+        on_display = set()
+        for i in in_view | self.in_view:
+            ghost = ghosts[i]
+            ghost.updateRelativeSenseData(sense_orientation)
+            ghost.relative_sense.updatePxlPos(geometry)
+            if geometry.isOnDisplay(ghost.relative_sense.pxl_pos):
+                on_display.add(i)
+
+        # Panic rises while on the display and falls while off it
+        for i in on_display | self.on_display:
+            ghost = ghosts[i]
+            self.settlePanic(i, i in self.on_display, now)
+            panicked = ghost.panic_progress >= ghost.panic_threshold
+            self.setPanicked(i, panicked)
+
+            if i in on_display:
+                self.cancel(i, GhostEvent.CALM)
+            elif panicked:
+                # Just left the display; calms down once panic has fallen back to the threshold
+                self.schedule(i, GhostEvent.CALM, now + ghost.panic_progress - ghost.panic_threshold)
+
+        self.in_view = in_view
+        self.on_display = on_display
+        self.compactQueue()
+        return [ghosts[i] for i in sorted(in_view)]
+
+    def ringCells(self, centre_column: int, centre_row: int, ring: int):
+        """ Yields the cells on the border of a square of cells, ring cells out from a centre cell; columns wrap
+        around, and rows beyond the grid are left out.
+        """
+        for row in range(max(0, centre_row - ring), min(self.num_rows - 1, centre_row + ring) + 1):
+            # Rows along the top and bottom of the square are whole; the rest only have the two sides
+            if abs(row - centre_row) == ring:
+                column_offsets = range(-ring, ring + 1)
+            else:
+                column_offsets = (-ring, ring) if ring else (0,)
+            for column_offset in column_offsets:
+                yield row * self.num_columns + (centre_column + column_offset) % self.num_columns
+
+    def findNearestGhost(self, sense_orientation: dict):
+        """ Finds the ghost nearest to where the sense HAT is facing, searching one ring of cells at a time outwards,
+        until no cell left can hold a nearer ghost. The relative data of each ghost searched is updated.
+
+        Returns:
+            Ghost: The nearest ghost, or None if there are no ghosts.
+        """
+        ghosts = self.engine.ghosts
+        cell_size = self.cell_size
+        centre_column = floor(sense_orientation["yaw"] / cell_size) % self.num_columns
+        centre_row = min(floor(-calcYAngularDisp(0, sense_orientation["roll"]) / cell_size), self.num_rows - 1)
+
+        nearest = None
+        nearest_distance = inf
+        searched = set()
+        for ring in range(max(self.num_columns // 2, self.num_rows) + 1):
+            # Every ghost in this ring or beyond is at least ring - 1 cells away on one axis
+            if (ring - 1) * cell_size >= nearest_distance:
+                break
+
+            for cell in self.ringCells(centre_column, centre_row, ring):
+                # Columns wrapping around may reach cells already searched
+                if cell in searched:
+                    continue
+                searched.add(cell)
+
+                for i in self.cells[cell]:
+                    ghost = ghosts[i]
+                    ghost.updateRelativeSenseData(sense_orientation)
+                    if ghost.relative_sense.distance < nearest_distance:
+                        nearest = ghost
+                        nearest_distance = ghost.relative_sense.distance
+
+        return nearest
@@ -66,52 +66,58 @@ def calcDist(x_disp: float, y_disp: float) -> float:
     return ((x_disp ** 2) + (y_disp ** 2)) ** 0.5
 
 
-def calcPxlPos(x_disp: float, y_disp: float) -> list:
+def calcPxlPos(x_disp: float, y_disp: float, width=8, height=8, view_range=RANGE) -> list:
     """ Determines the position on the sense HAT matrix the centre of the ghost should appear; does not limit to
     sense HAT matrix dimensions.
 
     Args:
         x_disp (float): Horizontal component of displacement.
         y_disp (float): Vertical component of displacement.
+        width (int): The width of the matrix in pixels.
+        height (int): The height of the matrix in pixels.
+        view_range (float): The displacement (in degrees) at which a ghost reaches the edge of the matrix.
 
     Returns:
         list: A list containing (horizontal coordinate, vertical coordinate); may take values beyond sense HAT matrix.
     """
 
     # Calculate pixel positions: each axis position is linearly related to the angle difference on that axis.
-    """ Derivation
+    """ Derivation (for a width W, shown for the 8 pixel wide sense HAT matrix where W = 8)
     y = mx + c
-    When x = 0, y = 4, but y = c; so c = 3
+    When x = 0, y = W/2, but y = c; so c = W/2 - 1 = 3
     
     y = mx + 3
-    When x = L, y = 7  (that is, when difference = limit, pixel should be at edge)
+    When x = L, y = W - 1 = 7  (that is, when difference = limit, pixel should be at edge)
     so 7 = mL + 3
     
-    mL = 4
+    mL = 4 = W/2
     
     m = 4/L
     
     Y = 4x/L + 3
     """
     # Y value has to be inverted for some reason
-    pxl_x = round(4 * x_disp / RANGE + 3)
-    pxl_y = round(4 * -y_disp / RANGE + 3)
+    pxl_x = round((width / 2) * x_disp / view_range + (width / 2 - 1))
+    pxl_y = round((height / 2) * -y_disp / view_range + (height / 2 - 1))
 
     return [pxl_x, pxl_y]
 
 
-def checkPxlDistsFromEdge(pxl_pos: list) -> list:
+def checkPxlDistsFromEdge(pxl_pos: list, width=8, height=8) -> list:
     """ Calculates the distance of some pixel from the edge of the sense HAT matrix.
 
     Args:
         pxl_pos: The coordinates on the matrix to check in the form [x coordinate, y coordinate].
+        width: The width of the matrix in pixels.
+        height: The height of the matrix in pixels.
 
     Returns:
         list: The distances from the edge of the sense HAT of each axis in the form [x distance, y distance].
-        Minimum distance of 0 when on edge, max 3 for each distance.
+        Minimum distance of 0 when on edge, max 3 for each distance on the 8x8 matrix.
     """
 
-    def calc(pos):
-        return 3.5 - abs(pos - 3.5)
+    def calc(pos, size):
+        middle = (size - 1) / 2
+        return middle - abs(pos - middle)
 
-    return [calc(pxl_pos[0]), calc(pxl_pos[1])]
+    return [calc(pxl_pos[0], width), calc(pxl_pos[1], height)]
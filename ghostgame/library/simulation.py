@@ -0,0 +1,358 @@
+import json
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math import sin
+from time import perf_counter
+
+from . import classes
+from .assets import AssetPack
+from .classes import GameManager, Ghost
+from .constants import AssetKind, GameState, StickDir, StickAct
+from .ghosttypes import ASSET_PACKS, GHOST_TYPES, getGhostTypeId, mountAssetPack
+from .movement import MovementEngine
+from .scheduler import GhostScheduler
+
+# Matches the fields of the sense_hat library's InputEvent, which are all that checkJoystickEvent uses
+StandInEvent = namedtuple("StandInEvent", ("timestamp", "direction", "action"))
+
+
+class SimClock:
+    """ A clock that only moves forward when told to, so that sessions can run faster than real time.
+
+    Attributes:
+        now (float): The current simulated time (since epoch).
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self) -> float:
+        """ Returns the current simulated time; used in place of time.time. """
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def installClock(clock: SimClock):
+    """ Makes the game classes read the time from a simulated clock. This affects the whole process, so each worker
+    process should only run one session at a time.
+    """
+    classes.time = clock.time
+
+
+class StandInStick:
+    """ Stands in for the sense HAT joystick; events are queued by a scripted player.
+
+    Attributes:
+        events (list): The events that will be returned by the next call to get_events.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def press(self, direction: StickDir, timestamp: float):
+        """ Queues a press and release of the joystick in some direction. """
+        self.events.append(StandInEvent(timestamp, direction.value, StickAct.PRESSED.value))
+        self.events.append(StandInEvent(timestamp, direction.value, StickAct.RELEASED.value))
+
+    def get_events(self) -> list:
+        events, self.events = self.events, []
+        return events
+
+
+class StandInSenseHat:
+    """ Stands in for the SenseHat object, so that a GameManager can run without the hardware.
+
+    Attributes:
+        orientation (dict): The roll, pitch and yaw returned by get_orientation_degrees; set by a scripted player.
+        stick (StandInStick): The stand-in joystick.
+        pixels (list): The pixels last passed to set_pixels.
+    """
+
+    def __init__(self):
+        self.orientation = {"roll": 90.0, "pitch": 0.0, "yaw": 0.0}
+        self.stick = StandInStick()
+        self.pixels = None
+
+    def get_orientation_degrees(self) -> dict:
+        return dict(self.orientation)
+
+    def set_imu_config(self, compass_enabled: bool, gyro_enabled: bool, accel_enabled: bool):
+        pass
+
+    def set_pixels(self, pixel_list: list):
+        self.pixels = pixel_list
+
+
+class SweepingPlayer:
+    """ A scripted player that turns on the spot while tilting up and down, attacking when a ghost is in focus.
+
+    Attributes:
+        rng (random.Random): The random number generator used by the player.
+        turn_speed (float): How fast the player turns, in degrees per second.
+        yaw (float): The horizontal angle the player is facing.
+        roll (float): The vertical angle the player is facing.
+    """
+
+    def __init__(self, rng: random.Random, turn_speed=30):
+        self.rng = rng
+        self.turn_speed = turn_speed
+        self.yaw = rng.uniform(0, 360)
+        self.roll = 90.0
+
+    def ghostInFocus(self, game_manager: GameManager) -> bool:
+        """ Checks if any ghost is inside the focus square. """
+        for ghost in game_manager.ghosts:
+            pxl_pos = ghost.relative_sense.pxl_pos
+            if pxl_pos and game_manager.geometry.isInFocus(pxl_pos):
+                return True
+        return False
+
+    def look(self, game_manager: GameManager, elapsed: float, frame_time: float):
+        """ Decides where to face this frame. """
+        self.yaw = (self.yaw + self.turn_speed * frame_time) % 360
+        self.roll = 90 + 60 * sin(elapsed / 4)
+
+    def update(self, game_manager: GameManager, hardware: StandInSenseHat, elapsed: float, frame_time: float):
+        """ Moves the stand-in sense HAT and presses the joystick, as a player would.
+
+        Args:
+            game_manager: The game being played.
+            hardware: The stand-in sense HAT to control.
+            elapsed: The simulated time in seconds since the session started.
+            frame_time: The simulated time in seconds between frames.
+        """
+        if self.ghostInFocus(game_manager):
+            # Wait for the charge bar to fill before attacking, since attempting early restarts the cooldown
+            attack_system = game_manager.attack_system
+            if attack_system.calcChargeBarHeight() >= attack_system.attack_cooldown:
+                hardware.stick.press(StickDir.MIDDLE, elapsed)
+        else:
+            self.look(game_manager, elapsed, frame_time)
+
+        hardware.orientation = {"roll": self.roll, "pitch": 0.0, "yaw": self.yaw}
+
+
+class TrackingPlayer(SweepingPlayer):
+    """ A scripted player that sweeps until a ghost is on the matrix, then turns towards it. """
+
+    def look(self, game_manager: GameManager, elapsed: float, frame_time: float):
+        # Find the nearest visible ghost
+        nearest_ghost = None
+        for ghost in game_manager.ghosts:
+            pxl_pos = ghost.relative_sense.pxl_pos
+            if pxl_pos and game_manager.geometry.isOnDisplay(pxl_pos):
+                if nearest_ghost is None or ghost.relative_sense.distance < nearest_ghost.relative_sense.distance:
+                    nearest_ghost = ghost
+
+        if nearest_ghost is None:
+            super().look(game_manager, elapsed, frame_time)
+            return
+
+        # Turn towards the ghost, no faster than the turn speed
+        max_turn = self.turn_speed * frame_time
+        x_disp = nearest_ghost.relative_sense.x_disp
+        y_disp = nearest_ghost.relative_sense.y_disp
+        self.yaw = (self.yaw + max(-max_turn, min(max_turn, x_disp))) % 360
+        self.roll = max(0.0, min(180.0, self.roll + max(-max_turn, min(max_turn, y_disp))))
+
+
+PLAYERS = {
+    "sweep": SweepingPlayer,
+    "track": TrackingPlayer,
+}
+
+
+def mountSimulationAssets(path: str):
+    """ Mounts an asset pack in this process, if it is not mounted already, and registers every ghost type in it, so
+    that sessions can spawn them by name or in a mix. Each worker process has its own registry, so this is done by
+    each session rather than by the process starting the run.
+    """
+    if any(pack.path == path for pack in ASSET_PACKS):
+        return
+
+    pack = AssetPack(path)
+    mountAssetPack(pack)
+    for name in pack.listAssets(AssetKind.GHOST_TYPE):
+        getGhostTypeId(name)
+
+
+def runSession(session_id: int, seed: int, num_ghosts=1, duration=60.0, frame_time=0.05, player="sweep",
+               ghost_type="basic", asset_pack=None) -> dict:
+    """ Plays a single game with stand-in hardware and a scripted player, on a simulated clock.
+
+    Args:
+        session_id: Identifies the session in the results.
+        seed: Seeds the ghosts' and player's random numbers, so that sessions can be repeated.
+        num_ghosts: The number of ghosts to spawn.
+        duration: How long to play for, in simulated seconds.
+        frame_time: The simulated time in seconds between frames.
+        player: The name of the scripted player to use, from PLAYERS.
+        ghost_type: The name of the type of ghost to spawn, or None to spawn a random mix of every registered type.
+        asset_pack: The path of an asset pack to load ghost types from, or None to only use the built in types.
+
+    Returns:
+        dict: The session's settings, throughput and gameplay metrics.
+    """
+    if asset_pack is not None:
+        mountSimulationAssets(asset_pack)
+
+    random.seed(seed)
+    clock = SimClock()
+    installClock(clock)
+
+    hardware = StandInSenseHat()
+    scripted_player = PLAYERS[player](random.Random(seed))
+
+    time_to_find = None
+    hits = 0
+    attacks = 0
+    panics = 0
+    frames = 0
+
+    start = perf_counter()
+    gm = GameManager(hardware, threaded=False, display="sensehat")
+    if ghost_type is None:
+        gm.ghosts = [Ghost(random.randrange(len(GHOST_TYPES))) for _ in range(num_ghosts)]
+    else:
+        gm.ghosts = [Ghost(getGhostTypeId(ghost_type)) for _ in range(num_ghosts)]
+    gm.game_state = GameState.PLAY
+    movement_engine = MovementEngine(gm.ghosts, seed=seed)
+    scheduler = GhostScheduler(movement_engine, gm.geometry, clock.now)
+    was_panicked = [False] * num_ghosts
+
+    # Mirrors the game loop in main.py
+    while clock.now < duration:
+        scripted_player.update(gm, hardware, clock.now, frame_time)
+
+        gm.attack_system.attempting_attack = False
+        gm.interpretNewEvents(gm.getNewJoystickEvents())
+        attacks += gm.attack_system.attempting_attack
+
+        gm.sense_ref.updateOrientation()
+        sense_orientation = gm.sense_ref.orientation_degrees
+        ghosts_in_view = scheduler.step(clock.now, sense_orientation)
+
+        # Record the first time any ghost appears on the matrix
+        if time_to_find is None and scheduler.on_display:
+            time_to_find = clock.now
+
+        # Count each time a ghost starts to panic; ghosts only start to panic while on the display, and one that
+        # calmed down off it is seen calm on its first frame back
+        for i in scheduler.on_display:
+            panics += scheduler.panicked[i] and not was_panicked[i]
+            was_panicked[i] = scheduler.panicked[i]
+
+        hits += len(gm.attack_system.processAttack(ghosts_in_view))
+        nearest_ghost = scheduler.findNearestGhost(sense_orientation)
+        gm.proximity_bar.update([nearest_ghost] if nearest_ghost is not None else [])
+        gm.prepareToRender(ghosts_in_view)
+        gm.render()
+
+        clock.advance(frame_time)
+        frames += 1
+
+    wall_seconds = perf_counter() - start
+
+    return {
+        "session_id": session_id,
+        "seed": seed,
+        "player": player,
+        "num_ghosts": num_ghosts,
+        "ghost_type": ghost_type,
+        "frames": frames,
+        "sim_seconds": clock.now,
+        "wall_seconds": wall_seconds,
+        "time_to_find": time_to_find,
+        "attacks": attacks,
+        "hits": hits,
+        "panics": panics,
+    }
+
+
+def makeSessions(num_sessions: int, base_seed=0, **settings) -> list:
+    """ Creates the settings for a number of sessions, each with its own seed; settings are passed to runSession. """
+    return [dict(settings, session_id=i, seed=base_seed + i) for i in range(num_sessions)]
+
+
+def loadResults(results_path: str) -> list:
+    """ Reads the results of finished sessions, ignoring a partially written final line. """
+    if not os.path.exists(results_path):
+        return []
+
+    results = []
+    with open(results_path) as file:
+        for line in file:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return results
+
+
+def sessionKey(session: dict) -> str:
+    """ Identifies a session by all of its settings, so that results are only reused by a session set up the same. """
+    return json.dumps(session, sort_keys=True)
+
+
+def runSessions(sessions: list, results_path: str, workers=None) -> list:
+    """ Runs sessions across a pool of processes, appending each result to a file as soon as it finishes. Sessions
+    already in the file with the same settings are skipped, so an interrupted run can be resumed by running it again.
+
+    Args:
+        sessions: The settings of each session, as made by makeSessions.
+        results_path: The file to append results to, one JSON object per line; each result holds the settings it
+            was run with.
+        workers: The number of processes to use; defaults to the number of CPUs.
+
+    Returns:
+        list: The results of the given sessions, in the same order, including ones finished by earlier runs.
+    """
+    # Results from runs with other settings (or from before settings were recorded) are left in the file but unused
+    finished = {sessionKey(result["settings"]): result
+                for result in loadResults(results_path) if "settings" in result}
+    remaining = [session for session in sessions if sessionKey(session) not in finished]
+
+    with ProcessPoolExecutor(workers) as executor, open(results_path, "a") as file:
+        futures = {executor.submit(runSession, **session): session for session in remaining}
+        for future in as_completed(futures):
+            result = dict(future.result(), settings=futures[future])
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            finished[sessionKey(result["settings"])] = result
+
+    return [finished[sessionKey(session)] for session in sessions]
+
+
+def summariseResults(results: list) -> dict:
+    """ Aggregates throughput and gameplay metrics over many sessions. Throughput is per worker process, so the
+    throughput of a whole run is roughly this multiplied by the number of workers.
+
+    Args:
+        results: The results of each session.
+
+    Returns:
+        dict: The totals and averages over all sessions.
+    """
+    def mean(values):
+        return sum(values) / len(values) if values else None
+
+    found = [result["time_to_find"] for result in results if result["time_to_find"] is not None]
+    frames = sum(result["frames"] for result in results)
+    sim_seconds = sum(result["sim_seconds"] for result in results)
+    wall_seconds = sum(result["wall_seconds"] for result in results)
+
+    return {
+        "sessions": len(results),
+        "frames": frames,
+        "frames_per_second": frames / wall_seconds if wall_seconds else None,
+        "speedup": sim_seconds / wall_seconds if wall_seconds else None,
+        "find_rate": len(found) / len(results) if results else None,
+        "mean_time_to_find": mean(found),
+        "mean_attacks": mean([result["attacks"] for result in results]),
+        "mean_hits": mean([result["hits"] for result in results]),
+        "mean_panics": mean([result["panics"] for result in results]),
+    }
@@ -0,0 +1,315 @@
+import os
+import struct
+from threading import Lock, Event
+from time import time
+
+import numpy as np
+
+from .constants import NUM_DIMS, GameState, HUDState, GhostState, SNAPSHOT_INTERVAL
+from .classes import Ghost, GhostRelativeSenseHAT
+from .concurrency import Worker
+from .ghosttypes import GHOST_TYPES, getGhostTypeId
+
+""" Snapshot format (all values little endian)
+
+Header:
+    magic (4 bytes), version (uint16), game state index (uint8), current dimension (uint8), HUD state index (uint8),
+    padding (1 byte), ghost count (uint32), number of ghost type names (uint16), length of type name table (uint32),
+    time saved at (float64), attack cooldown (uint16), time since last attack (float64)
+
+Type name table:
+    The names of the ghost types in use, separated by null bytes; type ids are not saved directly, as they depend
+    on the order types are registered in.
+
+Ghost section, each array holding one entry per ghost and written in bulk:
+    type index (uint16), state (uint8), dimension (uint8), angle (float64 x2), health (float32),
+    time since moved (float32), panic (float32 x2: progress, time since checked).
+
+Times are stored as ages relative to when the snapshot was made, so that cooldowns and delays carry on from where
+they were rather than expiring while the Pi was off.
+"""
+
+SNAPSHOT_MAGIC = b"GHST"
+SNAPSHOT_VERSION = 4
+
+_HEADER = struct.Struct("<4sHBBBxIHIdHd")
+
+_GAME_STATES = tuple(GameState)
+_HUD_STATES = tuple(HUDState)
+_GHOST_STATES = tuple(GhostState)
+
+# The ghost arrays in the order they are written, as (name, dtype, values per ghost)
+_GHOST_FIELDS = (
+    ("type_index", np.uint16, 1),
+    ("state", np.uint8, 1),
+    ("dim", np.uint8, 1),
+    ("angle", np.float64, 2),
+    ("health", np.float32, 1),
+    ("move_age", np.float32, 1),
+    ("panic", np.float32, 2),
+)
+_NUM_COLUMNS = sum(width for _, _, width in _GHOST_FIELDS)
+
+
+def encodeGhosts(ghosts: list, now: float) -> tuple:
+    """ Packs a list of ghosts into the ghost section of a snapshot.
+
+    Args:
+        ghosts: The ghosts to pack.
+        now: The time (since epoch) the snapshot is being made at; times are stored relative to this.
+
+    Returns:
+        tuple: (the type name table followed by the ghost arrays, the number of type names, the length in bytes of
+        the type name table).
+
+    Raises:
+        ValueError: If there are too many ghosts or ghost types to fit in the snapshot format.
+    """
+    n = len(ghosts)
+    if n > 0xffffffff:
+        raise ValueError(f"Too many ghosts to snapshot ({n}).")
+
+    # Build the type name table
+    type_ids = sorted({ghost.type_id for ghost in ghosts})
+    if len(type_ids) > 0xffff:
+        raise ValueError(f"Too many ghost types to snapshot ({len(type_ids)}).")
+    type_indexes = {type_id: i for i, type_id in enumerate(type_ids)}
+
+    # Gather each attribute into a row per ghost, then convert to arrays in one go
+    rows = [(type_indexes[ghost.type_id], ghost.state, ghost.current_dim,
+             ghost.angle[0], ghost.angle[1],
+             ghost.health,
+             now - ghost.time_last_moved,
+             ghost.panic_progress, now - ghost.time_last_panic_checked)
+            for ghost in ghosts]
+    table = np.array(rows, dtype=np.float64).reshape(n, _NUM_COLUMNS)
+
+    chunks = [b"\0".join(GHOST_TYPES[type_id].name.encode() for type_id in type_ids)]
+    if len(chunks[0]) > 0xffffffff:
+        raise ValueError("Ghost type names are too long to snapshot.")
+    column = 0
+    for _, dtype, width in _GHOST_FIELDS:
+        chunks.append(np.ascontiguousarray(table[:, column:column + width], dtype=dtype).tobytes())
+        column += width
+
+    return b"".join(chunks), len(type_ids), len(chunks[0])
+
+
+def encodeSnapshot(game_manager) -> bytes:
+    """ Packs the state of a game manager (game state, dimension, attack system, and ghosts) into a snapshot.
+
+    Args:
+        game_manager (GameManager): The game manager to save.
+
+    Returns:
+        bytes: The snapshot, ready to be written to disk.
+    """
+    now = time()
+    attack_system = game_manager.attack_system
+    ghost_data, num_type_names, type_table_len = encodeGhosts(game_manager.ghosts, now)
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                          _GAME_STATES.index(game_manager.game_state), game_manager.current_dim,
+                          _HUD_STATES.index(attack_system.hud_state), len(game_manager.ghosts),
+                          num_type_names, type_table_len,
+                          now, attack_system.attack_cooldown, now - attack_system.time_last_attacked)
+    return header + ghost_data
+
+
+def decodeGhosts(data, offset: int, n: int, num_type_names: int, type_table_len: int, now: float) -> list:
+    """ Rebuilds ghosts from the ghost section of a snapshot.
+
+    Args:
+        data: The snapshot data (bytes, or anything supporting the buffer protocol).
+        offset: Where the ghost section starts in data.
+        n: The number of ghosts to rebuild.
+        num_type_names: The number of names in the type name table.
+        type_table_len: The length in bytes of the type name table.
+        now: The time (since epoch) to treat as the moment the snapshot was made.
+
+    Returns:
+        list: The restored ghosts.
+    """
+    # Resolve type names to the ids they are registered under now
+    type_names = bytes(data[offset:offset + type_table_len]).decode().split("\0") if num_type_names else []
+    if len(type_names) != num_type_names:
+        raise ValueError(f"Snapshot type name table holds {len(type_names)} names, expected {num_type_names}.")
+    type_ids = [getGhostTypeId(name) for name in type_names]
+    offset += type_table_len
+
+    # Read each array, converting to Python values in bulk
+    arrays = {}
+    for name, dtype, width in _GHOST_FIELDS:
+        count = n * width
+        if offset + count * np.dtype(dtype).itemsize > len(data):
+            raise ValueError("Snapshot is truncated.")
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(n, width)
+        offset += arrays[name].nbytes
+
+    # Check the enum and index columns, so that a corrupt snapshot is reported rather than crashing later
+    if n:
+        if arrays["type_index"].max() >= num_type_names:
+            raise ValueError("Snapshot has a ghost with an out of range type index.")
+        if arrays["state"].max() >= len(_GHOST_STATES):
+            raise ValueError("Snapshot has a ghost with an unknown state.")
+        if arrays["dim"].min() < 1 or arrays["dim"].max() > NUM_DIMS:
+            raise ValueError("Snapshot has a ghost in an out of range dimension.")
+    fields = {name: array.tolist() for name, array in arrays.items()}
+
+    ghosts = []
+    for i in range(n):
+        # Bypass the constructor, which would randomise the ghost
+        ghost = Ghost.__new__(Ghost)
+        ghost.type_id = type_ids[fields["type_index"][i][0]]
+        ghost.state = _GHOST_STATES[fields["state"][i][0]]
+        ghost.current_dim = fields["dim"][i][0]
+        ghost.angle = fields["angle"][i]
+        ghost.health = fields["health"][i][0]
+        ghost.time_last_moved = now - fields["move_age"][i][0]
+        ghost.panic_progress, panic_age = fields["panic"][i]
+        ghost.time_last_panic_checked = now - panic_age
+        ghost.relative_sense = GhostRelativeSenseHAT(ghost)
+        ghosts.append(ghost)
+
+    return ghosts
+
+
+def decodeSnapshot(game_manager, data):
+    """ Restores the state of a game manager from a snapshot.
+
+    Args:
+        game_manager (GameManager): The game manager to restore into.
+        data: The snapshot data (bytes, or anything supporting the buffer protocol).
+
+    Raises:
+        ValueError: If the data is not a snapshot, was made by an unsupported version, or is corrupt.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Snapshot is truncated.")
+    (magic, version, game_state, current_dim, hud_state, n, num_type_names, type_table_len,
+     _, attack_cooldown, attack_age) = _HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Data is not a snapshot.")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}.")
+    if game_state >= len(_GAME_STATES):
+        raise ValueError(f"Snapshot has unknown game state {game_state}.")
+    if hud_state >= len(_HUD_STATES):
+        raise ValueError(f"Snapshot has unknown HUD state {hud_state}.")
+    if not 1 <= current_dim <= NUM_DIMS:
+        raise ValueError(f"Snapshot has out of range dimension {current_dim}.")
+    # The charge bar has a color for each second of the cooldown
+    if not 0 < attack_cooldown < len(game_manager.attack_system.charge_colors):
+        raise ValueError(f"Snapshot has out of range attack cooldown {attack_cooldown}.")
+
+    now = time()
+    game_manager.ghosts = decodeGhosts(data, _HEADER.size, n, num_type_names, type_table_len, now)
+    game_manager.game_state = _GAME_STATES[game_state]
+    game_manager.current_dim = current_dim
+    game_manager.attack_system.hud_state = _HUD_STATES[hud_state]
+    game_manager.attack_system.attack_cooldown = attack_cooldown
+    game_manager.attack_system.time_last_attacked = now - attack_age
+
+
+def writeAtomically(path: str, data: bytes):
+    """ Writes data to a file such that the file either holds the old contents or the new contents, never a mix,
+    even if power is lost part way through.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def saveSnapshot(game_manager, path: str):
+    """ Saves the state of a game manager to a file, blocking until written. """
+    writeAtomically(path, encodeSnapshot(game_manager))
+
+
+def loadSnapshot(game_manager, path: str) -> bool:
+    """ Restores the state of a game manager from a file.
+
+    Returns:
+        bool: Whether a snapshot was found and loaded.
+    """
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return False
+
+    decodeSnapshot(game_manager, data)
+    return True
+
+
+class SnapshotWriter:
+    """ Writes snapshots to disk on a background worker, so that the game loop does not wait on the SD card.
+    The game state is encoded on the calling thread, so that the snapshot is consistent; only the latest pending
+    snapshot is kept if the writer falls behind. If a write fails, the worker stops, and the error is raised by the
+    next call to requestSave, saveIfDue or stop.
+
+    Attributes:
+        path (str): The file snapshots are written to.
+        interval (float): The minimum time in seconds between snapshots made by saveIfDue.
+        time_last_saved (float): The time (since epoch) a snapshot was last requested.
+        pending (bytes): The snapshot waiting to be written, or None.
+        lock (Lock): Controls access to pending.
+        wake (Event): Set when there is a snapshot to write, or the writer should stop.
+        writer (Worker): Writes pending snapshots; started in constructor.
+    """
+
+    def __init__(self, path: str, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.time_last_saved = time()
+
+        self.pending = None
+        self.lock = Lock()
+        self.wake = Event()
+
+        self.writer = Worker("snapshot writer", self.waitAndWrite)
+        self.writer.start()
+
+    def writePending(self):
+        """ Writes the pending snapshot, if there is one. """
+        with self.lock:
+            data, self.pending = self.pending, None
+        if data is not None:
+            writeAtomically(self.path, data)
+
+    def waitAndWrite(self):
+        """ Waits for a snapshot to be requested, or the writer to be stopped, then writes any pending snapshot. """
+        self.wake.wait()
+        self.wake.clear()
+        self.writePending()
+
+    def checkWriter(self):
+        """ Raises a RuntimeError if the writer has stopped because of an error. """
+        if self.writer.error is not None:
+            raise RuntimeError(f"Writing snapshot {self.path} failed.") from self.writer.error
+
+    def requestSave(self, game_manager):
+        """ Encodes the state of the game manager and queues it to be written. """
+        self.checkWriter()
+        data = encodeSnapshot(game_manager)
+        with self.lock:
+            self.pending = data
+        self.time_last_saved = time()
+        self.wake.set()
+
+    def saveIfDue(self, game_manager):
+        """ Requests a save if at least interval seconds have passed since the last one. """
+        if time() - self.time_last_saved > self.interval:
+            self.requestSave(game_manager)
+
+    def stop(self):
+        """ Stops the writer, then writes any snapshot still pending, waiting for it to be written. """
+        self.writer.stop()
+        self.wake.set()
+        self.writer.join()
+        self.checkWriter()
+
+        # The writer may have stopped between a request and writing it
+        self.writePending()
@@ -1,36 +1,100 @@
-from library.classes import Ghost, GameManager
-from library.constants import GameState
+import os
+from random import randint, Random
+from time import time
 
-gm = GameManager()
+from library.assets import AssetPack
+from library.classes import Ghost, GameManager, SenseHat
+from library.capture import FrameCapture
+from library.constants import GameState, NUM_DIMS, SNAPSHOT_PATH, CAPTURE_PATH, ASSET_PACK_PATH, DISPLAY
+from library.ghosttypes import BASIC, mountAssetPack
+from library.movement import MovementEngine
+from library.scheduler import GhostScheduler
+from library.simulation import StandInSenseHat, SweepingPlayer
+from library.snapshot import SnapshotWriter, loadSnapshot
 
-# Initialise ghosts
-gm.ghosts = [Ghost()]
+# Without the sense_hat library, e.g. when previewing on a desktop, use stand-in hardware moved by a scripted player
+stand_in = None
+scripted_player = None
+if SenseHat is None and DISPLAY != "sensehat":
+    stand_in = StandInSenseHat()
+    scripted_player = SweepingPlayer(Random())
+
+gm = GameManager(stand_in, display=DISPLAY)
+
+# Record frames for debugging
+if CAPTURE_PATH is not None:
+    gm.frame_capture = FrameCapture(CAPTURE_PATH, gm.geometry.width, gm.geometry.height)
+
+# Load ghost types and spawn tables made with asset_compiler.py; without a pack, only the built in types are used
+asset_pack = None
+if os.path.exists(ASSET_PACK_PATH):
+    try:
+        asset_pack = AssetPack(ASSET_PACK_PATH)
+        mountAssetPack(asset_pack)
+    except ValueError as e:
+        # The pack is unreadable, e.g. cut short or made by an older compiler; carry on with the built in types
+        print(f"Could not load asset pack: {e}")
+
+# Restore the game from before the Pi was last turned off, otherwise initialise ghosts
+try:
+    restored = loadSnapshot(gm, SNAPSHOT_PATH)
+except ValueError as e:
+    # The snapshot is unreadable, e.g. saved by an older version; start a new game
+    print(f"Could not restore game: {e}")
+    restored = False
+if not restored:
+    # Pick the type of ghost from the spawn table of the dimension it spawns in
+    dim = randint(1, NUM_DIMS)
+    type_id = asset_pack.pickGhostType(dim) if asset_pack is not None else BASIC
+    gm.ghosts = [Ghost(type_id, dim)]
+
+if stand_in is not None:
+    # There is no joystick to start the game from the menu with
+    gm.game_state = GameState.PLAY
+
+# Moves ghosts in bulk, when the scheduler finds them due to move
+movement_engine = MovementEngine(gm.ghosts)
+scheduler = GhostScheduler(movement_engine, gm.geometry, time())
+
+# Saves the game in the background
+snapshot_writer = SnapshotWriter(SNAPSHOT_PATH)
 
 # Game loop
+start_time = time()
+time_last_frame = start_time
 while True:
     gm.attack_system.attempting_attack = False
 
+    # Look around and attack as a player would, if there is no sense HAT to move
+    if scripted_player is not None:
+        now = time()
+        scripted_player.update(gm, stand_in, now - start_time, now - time_last_frame)
+        time_last_frame = now
+
     # Get inputs from joystick
     new_events = gm.getNewJoystickEvents()
     gm.interpretNewEvents(new_events)
 
     # Continue playing game
     if gm.game_state == GameState.PLAY:
-        # Make list of blank RGB values for rendering ghost images
-
-        # Update ghosts
+        # Move the ghosts that are due to, and update the ghosts in view
         sense_orientation = gm.sense_ref.orientation_degrees
-        for ghost in gm.ghosts:
-            ghost.updateGhost(sense_orientation)
+        ghosts_in_view = scheduler.step(time(), sense_orientation)
 
-        # todo process attacking
+        # Attack ghosts in focus; only ghosts in view can be in focus
+        gm.attack_system.processAttack(ghosts_in_view)
 
-        # Update proximity bar
-        gm.proximity_bar.update(gm.ghosts)
+        # Update proximity bar; there is no nearest ghost once every ghost is gone
+        nearest_ghost = scheduler.findNearestGhost(sense_orientation)
+        gm.proximity_bar.update([nearest_ghost] if nearest_ghost is not None else [])
 
         # Update LED matrix
+        gm.prepareToRender(ghosts_in_view)
         gm.render()
 
+        # Periodically save the game
+        snapshot_writer.saveIfDue(gm)
+
     # Paused
     elif gm.game_state == GameState.PAUSED:
         print("Paused")
@@ -42,4 +106,14 @@ while True:
     # Shut down Pi if shutdown sequence input
     if gm.shutdown_checker.update(new_events):
         print("shut down signal")
+        # Save the game before shutting down, waiting for it to be written
+        snapshot_writer.requestSave(gm)
+        snapshot_writer.stop()
+        if gm.frame_capture is not None:
+            gm.frame_capture.close()
+        gm.sense_ref.stop()
+        if asset_pack is not None:
+            asset_pack.close()
         # os.system("sudo shutdown now")
+        # Everything the loop uses has been stopped or closed, so stop the program (see ShutdownChecker's debug)
+        break
@@ -0,0 +1,45 @@
+import argparse
+import json
+import os
+from time import perf_counter
+
+from library.assets import AssetPack
+from library.constants import ASSET_PACK_PATH
+from library.simulation import PLAYERS, makeSessions, runSessions, summariseResults
+
+# Plays many headless sessions with scripted players to help balance the game, e.g.
+# `python simulate.py 1000 --ghosts 5 --player track`. Rerun with the same settings and results file to resume.
+
+parser = argparse.ArgumentParser(description="Run headless game sessions with scripted players.")
+parser.add_argument("sessions", type=int, help="number of sessions to run")
+parser.add_argument("--ghosts", type=int, default=1, help="ghosts per session")
+parser.add_argument("--duration", type=float, default=60, help="simulated seconds per session")
+parser.add_argument("--frame-time", type=float, default=0.05, help="simulated seconds per frame")
+parser.add_argument("--player", choices=PLAYERS, default="sweep", help="scripted player to use")
+parser.add_argument("--ghost-type", default="basic", help="type of ghost to spawn, or 'mixed' for every type")
+parser.add_argument("--assets", default=ASSET_PACK_PATH,
+                    help="asset pack to load ghost types from, if it exists; 'none' for only the built in types")
+parser.add_argument("--seed", type=int, default=0, help="seed of the first session")
+parser.add_argument("--workers", type=int, default=None, help="processes to use; defaults to the number of CPUs")
+parser.add_argument("--results", default="simulation_results.jsonl", help="file to append results to")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    asset_pack = None
+    if args.assets != "none" and os.path.exists(args.assets):
+        # Check the pack here, rather than have every worker fail on it
+        try:
+            AssetPack(args.assets).close()
+        except ValueError as e:
+            parser.error(f"Could not load asset pack: {e}")
+        asset_pack = os.path.abspath(args.assets)
+
+    sessions = makeSessions(args.sessions, args.seed, num_ghosts=args.ghosts, duration=args.duration,
+                            frame_time=args.frame_time, player=args.player,
+                            ghost_type=None if args.ghost_type == "mixed" else args.ghost_type, asset_pack=asset_pack)
+
+    start = perf_counter()
+    results = runSessions(sessions, args.results, args.workers)
+    print(f"Finished in {perf_counter() - start:.1f} seconds")
+
+    print(json.dumps(summariseResults(results), indent=4))